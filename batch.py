@@ -0,0 +1,138 @@
+import cProfile
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from sqlhelp import SQLHelper, profile_enabled, GREEN, YELLOW, RED, RESET
+from sql_spans import open_mapped
+from metrics import Metrics, NULL_METRICS, capture
+
+# 清单每行必须包含的字段（region 可省略，默认取配置中的第一个区划）
+REQUIRED_FIELDS = ('database', 'version', 'requirement_id', 'description', 'sql_path')
+# 可在清单行中单独指定的生成选项，未指定时使用命令行参数
+OPTION_FIELDS = ('schema_snapshot', 'drop_applied', 'table_guards', 'merge_alters', 'insert_batch_rows',
+                 'insert_batch_bytes', 'dml_batch_size', 'dml_sleep', 'dml_max_batches', 'dml_remainder',
+                 'table_stats', 'online_ddl', 'osc_threshold', 'osc_tool', 'order_ddl')
+# 清单中相对于清单文件所在目录的路径字段
+PATH_FIELDS = ('sql_path', 'schema_snapshot', 'table_stats')
+
+# 每个工作进程各自持有一个 SQLHelper，避免每行重复解析配置
+_helper = None
+# 启用统计时为 (cProfile 文件, 是否统计内存)
+_profile = None
+_profiler = None
+
+
+def _init_worker(config_path, profile=None):
+    global _helper, _profile, _profiler
+    _helper = SQLHelper(config_path)
+    _profile = profile
+    if profile and profile[0]:
+        _profiler = cProfile.Profile()
+
+
+def build_user_input(row):
+    """清单行转换为 SQLHelper 的 user_input（不含 sql）"""
+    user_input = {key: row[key] for key in ('database', 'version', 'region', 'requirement_id', 'description')}
+    user_input.update((key, row[key]) for key in OPTION_FIELDS + ('date',) if key in row)
+    return user_input
+
+
+def _generate(row):
+    """在工作进程中生成单个脚本，返回 (文件路径列表, SQL字节数, 统计记录或 None)"""
+    user_input = build_user_input(row)
+    cpu_path, memory = _profile or (None, False)
+    metrics = _helper.metrics = Metrics('row') if _profile else NULL_METRICS
+    # 同一工作进程的 cProfile 结果在 _profiler 上累计，写到 文件.进程号
+    with capture(metrics, cpu_path and f'{cpu_path}.{os.getpid()}', memory, _profiler):
+        with open_mapped(row['sql_path']) as buffer:
+            user_input['sql'] = buffer
+            file_paths = _helper.write_groovy_files(user_input)
+            size = len(buffer)
+    return file_paths, size, metrics.record() if metrics.enabled else None
+
+
+def load_manifest(manifest_path, default_region, defaults=None):
+    """读取 JSONL 清单，返回 [(行号, 行数据, 错误信息)]"""
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    rows = []
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as e:
+                rows.append((line_no, None, f"JSON 格式不正确：{e}"))
+                continue
+            missing = [key for key in REQUIRED_FIELDS if not row.get(key)]
+            if missing:
+                rows.append((line_no, row, f"缺少字段：{', '.join(missing)}"))
+                continue
+            row.setdefault('region', default_region)
+            # SQL 路径与快照、统计文件路径相对于清单文件所在目录
+            for key in PATH_FIELDS:
+                if row.get(key):
+                    row[key] = os.path.join(base_dir, row[key])
+            for key in OPTION_FIELDS:
+                if defaults and key in defaults:
+                    row.setdefault(key, defaults[key])
+            rows.append((line_no, row, None))
+    return rows
+
+
+def run_batch(manifest_path, config_path='config.json', workers=None, options=None):
+    """按清单并行生成脚本，返回失败的行数；options 为各行生成选项的默认值"""
+    config_path = os.path.abspath(config_path)
+    helper = SQLHelper(config_path)
+    rows = load_manifest(manifest_path, helper.config.regions[0], options)
+    total = len(rows)
+    failed = 0
+    sql_bytes = 0
+    started = time.perf_counter()
+    # 各行的统计记录在主进程中汇总为一条
+    metrics = None
+    profile = None
+    generated = []
+    if options and profile_enabled(options):
+        metrics = Metrics('batch')
+        profile = (options.get('profile_cpu'), options.get('profile_memory'))
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(config_path, profile)) as pool:
+        futures = {}
+        for line_no, row, error in rows:
+            if error:
+                failed += 1
+                print(f"{RED}[第{line_no}行] 失败：{error}{RESET}")
+            else:
+                futures[pool.submit(_generate, row)] = line_no
+
+        for future in as_completed(futures):
+            line_no = futures[future]
+            try:
+                file_paths, size, record = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"{RED}[第{line_no}行] 失败：{e}{RESET}")
+            else:
+                sql_bytes += size
+                generated += file_paths
+                if metrics:
+                    metrics.merge(record)
+                print(f"{GREEN}[第{line_no}行] 已生成：{', '.join(file_paths)}{RESET}")
+
+    elapsed = time.perf_counter() - started
+    succeeded = total - failed
+    color = GREEN if not failed else YELLOW
+    print(f"\n{color}共 {total} 行，成功 {succeeded}，失败 {failed}，"
+          f"耗时 {elapsed:.2f}s，{succeeded / elapsed if elapsed else 0:.1f} 个/秒，"
+          f"{sql_bytes / 1024 / 1024 / elapsed if elapsed else 0:.2f} MB/秒{RESET}")
+    if options and options.get('sync'):
+        from version_sync import run_sync, DEFAULT_SYNC_WORKERS
+        failed += run_sync(helper, generated, options.get('sync_workers') or DEFAULT_SYNC_WORKERS)
+    if metrics:
+        metrics.count('rows', total - failed)
+        metrics.count('sql_bytes', sql_bytes)
+        metrics.emit(options.get('profile'))
+    return failed
@@ -0,0 +1,263 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from sql_lexer import iter_statements
+from sql_spans import open_mapped
+from sqlhelp import SQLHelper, GREEN, YELLOW, RED, RESET
+
+# 各阶段：解析（切分语句）、分析（分类并生成判断SQL）、渲染（拼 Groovy 代码）、写入（从文件到 groovy 的完整流程）
+STAGES = ('parse', 'analyze', 'render', 'write')
+DEFAULT_SIZES = '1k,100k'
+DEFAULT_TOLERANCE = 0.1
+
+_COUNT_UNITS = {'k': 1000, 'm': 1000 ** 2}
+
+
+def parse_count(text):
+    """解析语句数（如 1k、100k、1m）"""
+    text = text.strip().lower()
+    if text[-1:] in _COUNT_UNITS:
+        return int(float(text[:-1]) * _COUNT_UNITS[text[-1]])
+    return int(text)
+
+
+def format_count(count):
+    for unit, size in sorted(_COUNT_UNITS.items(), key=lambda item: -item[1]):
+        if count >= size and count % size == 0:
+            return f'{count // size}{unit}'
+    return str(count)
+
+
+def ddl_corpus(count):
+    """DDL 为主：加字段、改字段、加索引、建表交替出现，表名循环使用"""
+    for i in range(count):
+        table = f't_order_{i % 500}'
+        kind = i % 4
+        if kind == 0:
+            yield f"ALTER TABLE `{table}` ADD COLUMN `c_{i}` varchar(64) DEFAULT NULL COMMENT '字段{i}';\n"
+        elif kind == 1:
+            yield f"ALTER TABLE {table} MODIFY COLUMN c_{i - 1} varchar(128) DEFAULT NULL;\n"
+        elif kind == 2:
+            yield f"CREATE INDEX idx_{table}_{i} ON {table} (c_{i - 2}, c_{i - 1});\n"
+        else:
+            yield (f"CREATE TABLE IF NOT EXISTS t_new_{i} (id bigint NOT NULL AUTO_INCREMENT, "
+                   f"name varchar(64) NOT NULL, PRIMARY KEY (id)) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;\n")
+
+
+def insert_corpus(count):
+    """大量单行 INSERT，值中包含引号内的分号和转义"""
+    for i in range(count):
+        yield (f"INSERT INTO t_dict (id, code, name, remark) VALUES "
+               f"({i}, 'C{i:08d}', '名称{i}', 'a;b\\'c {i}');\n")
+
+
+def long_corpus(count):
+    """跨多行的长语句：带注释的 UPDATE 与多字段 CREATE TABLE"""
+    for i in range(count):
+        if i % 2:
+            columns = ',\n'.join(f"    col_{j} varchar(32) DEFAULT NULL COMMENT '第{j}列;'" for j in range(30))
+            yield f"CREATE TABLE t_wide_{i} (\n    id bigint NOT NULL,\n{columns},\n    PRIMARY KEY (id)\n);\n"
+        else:
+            cases = '\n'.join(f"        WHEN {j} THEN 'v{j}' -- 分支 {j}" for j in range(20))
+            yield (f"/* 批量修正 {i} */\nUPDATE t_order\nSET status = CASE type\n{cases}\n"
+                   f"        ELSE status\n    END\nWHERE batch_no = {i};\n")
+
+
+CORPORA = {
+    'ddl': ddl_corpus,
+    'insert': insert_corpus,
+    'long': long_corpus,
+}
+
+
+class _NullWriter:
+    """只统计字符数的文件对象，用于单独测量渲染"""
+
+    def __init__(self):
+        self.size = 0
+
+    def write(self, text):
+        self.size += len(text)
+        return len(text)
+
+
+def _measure(func, repeat, memory):
+    """执行 repeat 次取最短耗时；memory 为真时再执行一次记录 Python 分配的内存峰值"""
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    peak = None
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            func()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return best, peak
+
+
+def _make_config(work_dir):
+    """基准测试使用的临时配置，输出写到临时目录"""
+    config_path = os.path.join(work_dir, 'config.json')
+    with open(config_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'root_dir': os.path.join(work_dir, 'out'),
+            'version_dir': os.path.join(work_dir, 'release'),
+            'responsible_person': 'benchmark',
+            'databases': ['bench'],
+            'versions': ['V7.1.0'],
+            'regions': ['通用执行'],
+        }, f, ensure_ascii=False)
+    return config_path
+
+
+def run_corpus(helper, corpus, count, work_dir, stages, repeat=1, memory=True):
+    """对一个语料跑各阶段，返回 {阶段: 结果}"""
+    sql_path = os.path.join(work_dir, f'{corpus}_{count}.sql')
+    with open(sql_path, 'w', encoding='utf-8') as f:
+        f.writelines(CORPORA[corpus](count))
+    with open(sql_path, 'r', encoding='utf-8') as f:
+        sql = f.read()
+    size = os.path.getsize(sql_path)
+    user_input = {'database': 'bench', 'version': 'V7.1.0', 'region': '通用执行',
+                  'requirement_id': '0', 'description': f'{corpus}_{count}', 'date': '20000101'}
+    sql_metas = helper.analyze_sql(sql) if 'render' in stages else None
+
+    def parse():
+        for _ in iter_statements(sql):
+            pass
+
+    def analyze():
+        helper.analyze_sql(sql)
+
+    def render():
+        sink = _NullWriter()
+        for part, part_metas in enumerate(helper.split_sql_metas(sql_metas), 1):
+            helper.write_groovy_content(sink, user_input, part_metas, part=part)
+
+    def write():
+        # 每次写入前清空输出目录，避免内容相同时跳过写入
+        shutil.rmtree(helper.config.root_dir, ignore_errors=True)
+        with open_mapped(sql_path) as buffer:
+            helper.write_groovy_files(dict(user_input, sql=buffer))
+
+    funcs = {'parse': parse, 'analyze': analyze, 'render': render, 'write': write}
+    results = {}
+    for stage in stages:
+        seconds, peak = _measure(funcs[stage], repeat, memory)
+        results[stage] = {
+            'seconds': round(seconds, 6),
+            'statements_per_sec': round(count / seconds, 1) if seconds else None,
+            'mb_per_sec': round(size / 1024 / 1024 / seconds, 3) if seconds else None,
+            'peak_mb': round(peak / 1024 / 1024, 3) if peak is not None else None,
+        }
+    os.remove(sql_path)
+    return results
+
+
+def run_benchmarks(corpora, sizes, stages, repeat=1, memory=True):
+    """依次运行各语料、各规模，返回可保存为基线的结果"""
+    work_dir = tempfile.mkdtemp(prefix='sqlhelp_bench_')
+    try:
+        helper = SQLHelper(_make_config(work_dir))
+        results = {}
+        for corpus in corpora:
+            for count in sizes:
+                label = f'{corpus}/{format_count(count)}'
+                print(f"运行 {label} ……", flush=True)
+                for stage, result in run_corpus(helper, corpus, count, work_dir, stages, repeat, memory).items():
+                    results[f'{label}/{stage}'] = result
+                    peak = f"{result['peak_mb']:.1f} MB" if result['peak_mb'] is not None else '-'
+                    print(f"  {stage:<8}{result['seconds']:>10.3f}s{result['statements_per_sec'] or 0:>14,.0f} 条/秒"
+                          f"{result['mb_per_sec'] or 0:>10.2f} MB/秒  峰值 {peak}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'results': results,
+    }
+
+
+def compare(current, baseline, tolerance=DEFAULT_TOLERANCE):
+    """与基线比较，吞吐下降或内存峰值增长超过 tolerance 的视为退化，返回退化项数"""
+    regressions = 0
+    print(f"\n与基线比较（{baseline.get('created', '-')}，Python {baseline.get('python', '-')}，容差 {tolerance:.0%}）：")
+    for key, result in current['results'].items():
+        base = baseline.get('results', {}).get(key)
+        if not base:
+            print(f"  {key:<24}基线中没有该项")
+            continue
+        messages = []
+        regressed = False
+        if result['statements_per_sec'] and base.get('statements_per_sec'):
+            ratio = result['statements_per_sec'] / base['statements_per_sec']
+            messages.append(f"吞吐 {ratio - 1:+.1%}")
+            regressed |= ratio < 1 - tolerance
+        if result['peak_mb'] is not None and base.get('peak_mb'):
+            ratio = result['peak_mb'] / base['peak_mb']
+            messages.append(f"内存峰值 {ratio - 1:+.1%}")
+            regressed |= ratio > 1 + tolerance
+        regressions += regressed
+        color = RED if regressed else GREEN
+        print(f"  {color}{key:<24}{'，'.join(messages)}{'  退化' if regressed else ''}{RESET}")
+    if regressions:
+        print(f"\n{RED}{regressions} 项超出容差{RESET}")
+    else:
+        print(f"\n{GREEN}未发现退化{RESET}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='benchmark', description='sqlhelp 解析、分析、渲染、写入各阶段的基准测试（无需联网）')
+    parser.add_argument('--corpus', default=','.join(CORPORA), help=f"语料，逗号分隔，可选 {', '.join(CORPORA)}")
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help='语句数，逗号分隔，如 1k,100k,1m')
+    parser.add_argument('--stages', default=','.join(STAGES), help=f"阶段，逗号分隔，可选 {', '.join(STAGES)}")
+    parser.add_argument('--repeat', type=int, default=1, help='每项重复次数，取最短耗时')
+    parser.add_argument('--no-memory', action='store_true', help='不测量内存峰值（测量时每项多执行一次）')
+    parser.add_argument('--save', metavar='PATH', help='结果保存为基线 JSON')
+    parser.add_argument('--compare', metavar='PATH', help='与基线 JSON 比较，存在退化时退出码为 1')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help='允许的波动比例，默认 0.1')
+    args = parser.parse_args()
+
+    corpora = [name.strip() for name in args.corpus.split(',') if name.strip()]
+    stages = [name.strip() for name in args.stages.split(',') if name.strip()]
+    unknown = [name for name in corpora if name not in CORPORA] + [name for name in stages if name not in STAGES]
+    if unknown:
+        parser.error(f"未知的语料或阶段：{', '.join(unknown)}")
+    try:
+        sizes = [parse_count(size) for size in args.sizes.split(',') if size.strip()]
+    except ValueError:
+        parser.error(f"语句数格式不正确：{args.sizes}")
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    current = run_benchmarks(corpora, sizes, stages, args.repeat, not args.no_memory)
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(current, f, ensure_ascii=False, indent=2)
+        print(f"\n{YELLOW}基线已保存：{args.save}{RESET}")
+    if baseline is not None:
+        sys.exit(1 if compare(current, baseline, args.tolerance) else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+import time
+
+from script_catalog import ScriptCatalog
+from sqlhelp import RED, YELLOW, RESET
+
+DUPLICATE = 'duplicate'
+CONFLICT = 'conflict'
+
+_COLUMN_KINDS = ('add_column', 'modify_column', 'change_column', 'drop_column')
+_INDEX_KINDS = ('add_index', 'create_index', 'drop_index', 'drop_index_on')
+_ADD_INDEX = ('add_index', 'create_index')
+_DROP_INDEX = ('drop_index', 'drop_index_on')
+
+# 两个脚本中的同名对象：取出成对的子句（a.path < b.path 保证每对只出现一次）；
+# 内容相同的文件是同一脚本的副本（分发到各区划、同步到版本目录），不互相比较
+_PAIR_SQL = """
+SELECT a.path, a.kind, a.definition, b.path, b.kind, b.definition, a.schema_name, a.table_name, a.{name}
+FROM touches a
+JOIN touches b ON b.schema_name = a.schema_name AND b.table_name = a.table_name AND b.{name} = a.{name}
+                  AND b.path > a.path
+JOIN files fa ON fa.path = a.path
+JOIN files fb ON fb.path = b.path
+WHERE a.kind IN ({kinds}) AND b.kind IN ({kinds})
+  AND fa.sha256 != fb.sha256 {where}
+"""
+
+
+def classify_pair(kind_a, definition_a, kind_b, definition_b):
+    """判断同一对象上的两个操作：重复、冲突，或无问题（None）"""
+    kinds = {kind_a, kind_b}
+    same = (definition_a or '').lower() == (definition_b or '').lower()
+    if kind_a == kind_b and kind_a in ('create_table', 'drop_column') or kinds <= set(_DROP_INDEX):
+        return DUPLICATE
+    if 'drop_column' in kinds:
+        return CONFLICT
+    if kind_a == kind_b or kinds <= set(_ADD_INDEX):
+        return DUPLICATE if same else CONFLICT
+    if kinds & set(_ADD_INDEX) and kinds & set(_DROP_INDEX):
+        return CONFLICT
+    # 新增后在另一个脚本中修改：定义不一致时两处须确认以哪个为准
+    if kinds <= set(_COLUMN_KINDS) and not same:
+        return CONFLICT
+    return None
+
+
+def _version_filter(version_line, paths):
+    where = ''
+    params = []
+    if version_line:
+        where += (' AND (fa.version = ? OR fa.version LIKE ? || \'.%\')'
+                  ' AND (fb.version = ? OR fb.version LIKE ? || \'.%\')')
+        params += [version_line] * 4
+    if paths:
+        marks = ', '.join('?' * len(paths))
+        where += f' AND (a.path IN ({marks}) OR b.path IN ({marks}))'
+        params += list(paths) * 2
+    return where, params
+
+
+def find_conflicts(catalog, version_line=None, paths=None):
+    """在索引中查找跨脚本的重复或冲突操作，返回 [(类型, 对象, 子句a, 子句b)]
+
+    version_line 限定版本线（如 V7.1 匹配 V7.1 与 V7.1.x），paths 限定至少一方是这些文件。
+    子句为 (路径, 操作类型, 定义)。
+    """
+    where, params = _version_filter(version_line, paths)
+    results = []
+    queries = (
+        ('column_name', _COLUMN_KINDS),
+        ('index_name', _INDEX_KINDS),
+        ('kind', ('create_table',)),
+    )
+    for name, kinds in queries:
+        marks = ', '.join('?' * len(kinds))
+        sql = _PAIR_SQL.format(name=name, kinds=marks, where=where)
+        for path_a, kind_a, def_a, path_b, kind_b, def_b, schema, table, target in catalog.conn.execute(
+                sql, list(kinds) * 2 + params):
+            result = classify_pair(kind_a, def_a, kind_b, def_b)
+            if result:
+                label = f"{schema}.{table}" if name == 'kind' else f"{schema}.{table}.{target}"
+                results.append((result, label, (path_a, kind_a, def_a), (path_b, kind_b, def_b)))
+    results.sort(key=lambda item: (item[0] != CONFLICT, item[1]))
+    return results
+
+
+def print_conflicts(conflicts):
+    for result, label, *clauses in conflicts:
+        color = RED if result == CONFLICT else YELLOW
+        print(f"{color}[{'冲突' if result == CONFLICT else '重复'}] {label}{RESET}")
+        for path, kind, definition in clauses:
+            print(f"    {kind} {definition or ''}".rstrip())
+            print(f"        {path}")
+
+
+def run_check(catalog_path, roots, version_line=None, refresh=True):
+    """sqlhelp check：更新索引后检查全部脚本，返回冲突数"""
+    started = time.perf_counter()
+    with ScriptCatalog(catalog_path) as catalog:
+        if refresh:
+            catalog.refresh(roots)
+        conflicts = find_conflicts(catalog, version_line)
+    print_conflicts(conflicts)
+    errors = sum(1 for result, *_ in conflicts if result == CONFLICT)
+    print(f"\n冲突 {errors} 处，重复 {len(conflicts) - errors} 处，耗时 {(time.perf_counter() - started) * 1000:.0f} ms")
+    return errors
@@ -0,0 +1,295 @@
+import csv
+import json
+import re
+import shlex
+
+from sql_optimizer import AnnotatedMeta, RepeatedMeta, combine_guards, split_top_level
+from sql_rules import ALTER_PREFIX_RE, DEFAULT_RULES
+
+# 估算耗时用的吞吐（字节/秒）：INPLACE 重建与建索引、COPY 复制表
+INPLACE_BYTES_PER_SECOND = 50 * 1024 * 1024
+COPY_BYTES_PER_SECOND = 20 * 1024 * 1024
+OSC_TOOLS = ('gh-ost', 'pt-osc')
+
+# MySQL 5.7 各类子句的 Online DDL 支持：(ALGORITHM, LOCK, 代价类型)
+# 代价类型：meta 只改元数据，index 扫描数据建索引，rebuild 重建整张表
+_KIND_DDL = {
+    'add_index': ('INPLACE', 'NONE', 'index'),
+    'create_index': ('INPLACE', 'NONE', 'index'),
+    'drop_index': ('INPLACE', 'NONE', 'meta'),
+    'drop_index_on': ('INPLACE', 'NONE', 'meta'),
+    'add_column': ('INPLACE', 'NONE', 'rebuild'),
+    'drop_column': ('INPLACE', 'NONE', 'rebuild'),
+    # 无法得知原字段类型，按修改类型处理（需要 COPY）
+    'modify_column': ('COPY', 'SHARED', 'rebuild'),
+    'change_column': ('COPY', 'SHARED', 'rebuild'),
+}
+# 未识别的子句按最保守的方式估算
+_UNKNOWN_DDL = ('COPY', 'SHARED', 'rebuild')
+_COST_ORDER = ('meta', 'index', 'rebuild')
+
+_FULLTEXT_RE = re.compile(r'\b(?:fulltext|spatial)\b', re.I)
+_AUTO_INCREMENT_RE = re.compile(r'\bauto_increment\b', re.I)
+_ALTER_OPTION_RE = re.compile(r'\b(?:algorithm|lock)\s*=', re.I)
+_FOREIGN_KEY_RE = re.compile(r'\b(?:foreign\s+key|references)\b', re.I)
+_RENAME_RE = re.compile(r'\s*rename\b', re.I)
+_ALTER_TABLE_RE = re.compile(r'.*?\btable\s+(?:`?(\w+)`?\s*\.\s*)?`?(\w+)`?', re.I | re.S)
+_INDEX_STATEMENT_RE = re.compile(r'\s*(?:create|drop)\s+(?:unique\s+|fulltext\s+|spatial\s+)?index\b', re.I)
+
+
+class TableStats:
+    """表的统计信息（来自 information_schema.TABLES）"""
+
+    __slots__ = ('rows', 'data_length', 'index_length')
+
+    def __init__(self, rows=0, data_length=0, index_length=0):
+        self.rows = int(rows or 0)
+        self.data_length = int(data_length or 0)
+        self.index_length = int(index_length or 0)
+
+
+def _add_stats(table_stats, row):
+    row = {key.lower(): value for key, value in row.items()}
+    key = ((row.get('table_schema') or '').lower(), row['table_name'].lower())
+    table_stats[key] = TableStats(row.get('table_rows', row.get('rows')), row.get('data_length'),
+                                  row.get('index_length'))
+
+
+def load_table_stats(path):
+    """读取表统计文件，返回 {(库名, 表名): TableStats}，名称均为小写
+
+    .json 为 information_schema.TABLES 导出的行列表，或 {"库名.表名": {...}}；
+    其他扩展名按带表头的 CSV/TSV 读取（如 mysql -e 的输出）。
+    需要的字段：TABLE_SCHEMA（可省略）、TABLE_NAME、TABLE_ROWS、DATA_LENGTH、INDEX_LENGTH。
+    """
+    table_stats = {}
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        if path.lower().endswith('.json'):
+            data = json.load(f)
+            if isinstance(data, dict):
+                for name, row in data.items():
+                    schema, _, table = name.rpartition('.')
+                    _add_stats(table_stats, dict(row, table_schema=schema, table_name=table))
+            else:
+                for row in data:
+                    _add_stats(table_stats, row)
+        else:
+            dialect = 'excel-tab' if '\t' in f.readline() else 'excel'
+            f.seek(0)
+            for row in csv.DictReader(f, dialect=dialect):
+                _add_stats(table_stats, row)
+    return table_stats
+
+
+def format_bytes(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+def format_seconds(seconds):
+    if seconds < 60:
+        return f"{seconds:.0f} 秒"
+    if seconds < 3600:
+        return f"{seconds / 60:.1f} 分钟"
+    return f"{seconds / 3600:.1f} 小时"
+
+
+class DdlCost:
+    """一条 DDL 语句的代价估算"""
+
+    __slots__ = ('table', 'algorithm', 'lock', 'cost', 'size', 'seconds', 'stats', 'barrier')
+
+    def __init__(self, table, algorithm, lock, cost, stats, barrier=False):
+        self.table = table
+        # 包含改名或无法识别的子句，可能改变其他语句引用的对象，不参与调整顺序
+        self.barrier = barrier
+        self.algorithm = algorithm
+        self.lock = lock
+        self.cost = cost
+        self.stats = stats
+        self.size = self.seconds = None
+        if stats:
+            if cost == 'meta':
+                self.size = 0
+            elif cost == 'index':
+                self.size = stats.data_length
+            else:
+                self.size = stats.data_length + stats.index_length
+            rate = COPY_BYTES_PER_SECOND if algorithm == 'COPY' else INPLACE_BYTES_PER_SECOND
+            self.seconds = self.size / rate
+
+    @property
+    def online(self):
+        """执行期间不阻塞读写"""
+        return self.algorithm == 'INPLACE' and self.lock == 'NONE'
+
+    @property
+    def sort_key(self):
+        """阻塞读写的排后，同类中代价小的在前，缺少统计信息的最后"""
+        return (not self.online, self.seconds is None, self.seconds or 0)
+
+    def describe(self):
+        action = {'meta': '仅修改元数据', 'index': '建索引', 'rebuild': '重建表'}[self.cost]
+        mode = f"ALGORITHM={self.algorithm}, LOCK={self.lock}"
+        if not self.stats:
+            return f"{self.table}：{action}，{mode}，无统计信息"
+        text = f"{self.table}：约 {self.stats.rows:,} 行，{action}，{mode}"
+        if self.size:
+            text += f"，处理 {format_bytes(self.size)}，预计 {format_seconds(self.seconds)}"
+        return text
+
+
+def _clause_ddl(match, text):
+    ddl = _KIND_DDL.get(match.kind, _UNKNOWN_DDL)
+    if match.kind in ('add_index', 'create_index') and _FULLTEXT_RE.search(text):
+        ddl = ('INPLACE', 'SHARED', 'rebuild')
+    elif match.kind == 'add_column' and _AUTO_INCREMENT_RE.search(text):
+        ddl = _UNKNOWN_DDL
+    return ddl
+
+
+class DdlAdvisor:
+    """按表统计信息估算 ALTER TABLE / CREATE INDEX / DROP INDEX 的代价"""
+
+    def __init__(self, table_stats, database, rules=DEFAULT_RULES):
+        self.table_stats = table_stats
+        self.database = (database or '').lower()
+        self.rules = rules
+
+    def lookup(self, schema, table):
+        table = table.lower()
+        if schema:
+            return self.table_stats.get((schema.lower(), table))
+        return self.table_stats.get((self.database, table)) or self.table_stats.get(('', table))
+
+    def estimate(self, statement):
+        """返回 DdlCost，不是 DDL 语句时返回 None"""
+        prefix = ALTER_PREFIX_RE.match(statement)
+        if prefix:
+            head = statement[:prefix.end()]
+            schema, table = _ALTER_TABLE_RE.match(head).groups()
+            texts = split_top_level(statement[prefix.end():])
+            clauses = [self.rules.classify(head + clause) for clause in texts]
+            ddls = [_clause_ddl(clause, statement) if clause.kind else _UNKNOWN_DDL for clause in clauses]
+            barrier = any(_RENAME_RE.match(text) or not (clause.kind or _ALTER_OPTION_RE.match(text))
+                          for text, clause in zip(texts, clauses))
+        else:
+            match = self.rules.classify(statement)
+            if match.kind not in ('create_index', 'drop_index_on') or not match.table:
+                return None
+            schema, table = match.schema, match.table
+            ddls = [_clause_ddl(match, statement)]
+            barrier = False
+        algorithm = 'COPY' if any(ddl[0] == 'COPY' for ddl in ddls) else 'INPLACE'
+        lock = 'SHARED' if any(ddl[1] == 'SHARED' for ddl in ddls) else 'NONE'
+        cost = max((ddl[2] for ddl in ddls), key=_COST_ORDER.index)
+        name = f"{schema}.{table}" if schema else table
+        return DdlCost(name, algorithm, lock, cost, self.lookup(schema, table), barrier)
+
+
+def online_statement(statement):
+    """追加 ALGORITHM=INPLACE, LOCK=NONE；语句已指定时原样返回"""
+    if _ALTER_OPTION_RE.search(statement):
+        return statement
+    if _INDEX_STATEMENT_RE.match(statement):
+        return f"{statement} ALGORITHM=INPLACE LOCK=NONE"
+    return f"{statement}, ALGORITHM=INPLACE, LOCK=NONE"
+
+
+def osc_command(tool, schema, table, alter):
+    """生成 gh-ost / pt-online-schema-change 命令，连接信息从环境变量读取"""
+    if tool == 'pt-osc':
+        return (f'pt-online-schema-change --alter {shlex.quote(alter)} '
+                f'"h=$MYSQL_HOST,P=${{MYSQL_PORT:-3306}},u=$MYSQL_USER,p=$MYSQL_PASSWORD,'
+                f'D={schema},t={table}" --execute')
+    return (f'gh-ost --host="$MYSQL_HOST" --port="${{MYSQL_PORT:-3306}}" --user="$MYSQL_USER" '
+            f'--password="$MYSQL_PASSWORD" --database={shlex.quote(schema)} --table={shlex.quote(table)} '
+            f'--alter={shlex.quote(alter)} --allow-on-master --execute')
+
+
+def original_guard(statement, rules=DEFAULT_RULES):
+    """语句按规则生成的 information_schema 判断，不依赖会话变量，可单独执行
+
+    合并过的 ALTER 取各子句判断的组合；有子句没有判断时按整条语句分类。
+    """
+    prefix = ALTER_PREFIX_RE.match(statement)
+    if prefix:
+        head = statement[:prefix.end()]
+        texts = split_top_level(statement[prefix.end():])
+        if len(texts) > 1:
+            guards = [rules.classify(head + text).check_sql for text in texts]
+            if all(guards):
+                return combine_guards(guards)
+    return rules.classify(statement).check_sql
+
+
+def advise_ddl(sql_metas, advisor, online_ddl=False, osc_threshold=0, osc_tool='gh-ost', osc_commands=None,
+               reorder=False, stats=None):
+    """为 DDL 添加代价说明，按选项改写为 Online DDL 或转为外部工具执行，并可调整执行顺序
+
+    online_ddl：MySQL 5.7 支持时追加 ALGORITHM=INPLACE, LOCK=NONE；
+    osc_threshold：表数据量（字节）不小于该值的 ALTER TABLE 从脚本中移除，
+    改为向 osc_commands 追加 (判断SQL, 命令)，判断SQL 取 original_guard（脚本中的判断可能读取会话变量）；
+    reorder：连续的 DDL 中，不阻塞读写、代价小的先执行，同一张表的语句保持原有顺序；
+    涉及外键、包含改名或无法识别子句的 ALTER，以及建表、删表、改名表等语句不参与调整，
+    其前后的语句各自排序。
+    """
+    run = []
+    counts = {'ddl_annotated': 0, 'ddl_online': 0, 'ddl_osc': 0, 'ddl_reordered': 0}
+
+    def flush():
+        if not run:
+            return []
+        if not reorder or len(run) == 1:
+            items = [meta for _, _, meta in run]
+        else:
+            # 按表分组保持组内顺序，再按组内代价最大的语句排序
+            groups = {}
+            for key, cost, meta in run:
+                groups.setdefault(key, []).append((cost, meta))
+            ordered = sorted(groups.values(), key=lambda group: max(cost.sort_key for cost, _ in group))
+            items = [meta for group in ordered for _, meta in group]
+            if items != [meta for _, _, meta in run]:
+                counts['ddl_reordered'] += len(run)
+        run.clear()
+        return items
+
+    for meta in sql_metas:
+        check_sql, statement = meta
+        # 分批语句与合并 ALTER 后补执行的原语句不评估，原样保留
+        cost = None if isinstance(meta, (RepeatedMeta, AnnotatedMeta)) else advisor.estimate(statement)
+        if cost is None:
+            yield from flush()
+            yield meta
+            continue
+
+        counts['ddl_annotated'] += 1
+        comment = cost.describe()
+        prefix = ALTER_PREFIX_RE.match(statement)
+        if (osc_threshold and prefix and cost.size is not None and cost.stats.data_length >= osc_threshold
+                and osc_commands is not None):
+            schema, _, table = cost.table.rpartition('.')
+            alter = ' '.join(statement[prefix.end():].split())
+            osc_commands.append((original_guard(statement, advisor.rules),
+                                 osc_command(osc_tool, schema or advisor.database, table, alter)))
+            counts['ddl_osc'] += 1
+            yield from flush()
+            continue
+        if online_ddl and cost.online:
+            statement = online_statement(statement)
+            counts['ddl_online'] += 1
+
+        meta = AnnotatedMeta(check_sql, statement, comment)
+        if reorder and not cost.barrier and not _FOREIGN_KEY_RE.search(statement):
+            key = cost.table.lower() if '.' in cost.table else f"{advisor.database}.{cost.table.lower()}"
+            run.append((key, cost, meta))
+        else:
+            yield from flush()
+            yield meta
+    yield from flush()
+
+    if stats is not None:
+        stats.update(counts)
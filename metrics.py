@@ -0,0 +1,187 @@
+import cProfile
+import json
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+# 图形界面没有命令行参数，通过环境变量启用统计：输出目标（文件路径或 -）、cProfile 文件、是否统计内存
+PROFILE_ENV = 'SQLHELP_PROFILE'
+PROFILE_CPU_ENV = 'SQLHELP_PROFILE_CPU'
+PROFILE_MEMORY_ENV = 'SQLHELP_PROFILE_MEMORY'
+
+
+class _Span:
+    """计时区间：记录总耗时和扣除内层区间后的自身耗时"""
+
+    __slots__ = ('metrics', 'name', 'start', 'child')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.child = 0.0
+        self.metrics._stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        stack = self.metrics._stack
+        stack.pop()
+        if stack:
+            stack[-1].child += elapsed
+        entry = self.metrics.spans.get(self.name)
+        if entry is None:
+            entry = self.metrics.spans[self.name] = [0.0, 0.0, 0]
+        entry[0] += elapsed - self.child
+        entry[1] += elapsed
+        entry[2] += 1
+
+
+class _TimedWriter:
+    """包装文件对象，写入耗时计入 write 区间，写入字符数计入计数"""
+
+    def __init__(self, metrics, f):
+        self._metrics = metrics
+        self._f = f
+
+    def write(self, text):
+        with self._metrics.span('write'):
+            self._f.write(text)
+        self._metrics.count('chars_rendered', len(text))
+        return len(text)
+
+
+class Metrics:
+    """一次生成（或一批生成）的各阶段耗时与计数
+
+    span 按名称累计，内层区间的耗时不计入外层的 seconds（total 中包含），
+    各区间的 seconds 之和即为被统计部分的总耗时。
+    """
+
+    enabled = True
+
+    def __init__(self, name):
+        self.name = name
+        self.spans = {}  # 名称 -> [自身耗时, 总耗时, 次数]
+        self.counters = {}
+        self.extra = {}
+        self._stack = []
+        self._started = time.perf_counter()
+
+    def span(self, name):
+        return _Span(self, name)
+
+    def timed_iter(self, name, iterable):
+        """逐个取出 iterable 的元素，只把生成元素的耗时计入 name 区间（不含使用方的处理时间）"""
+        iterator = iter(iterable)
+        while True:
+            with self.span(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def writer(self, f):
+        return _TimedWriter(self, f)
+
+    def merge(self, record):
+        """并入另一条记录（如批量生成中各工作进程返回的记录）"""
+        for name, span in record['spans'].items():
+            entry = self.spans.setdefault(name, [0.0, 0.0, 0])
+            entry[0] += span['seconds']
+            entry[1] += span['total']
+            entry[2] += span['calls']
+        for name, value in record['counters'].items():
+            self.count(name, value)
+        if 'peak_memory_bytes' in record:
+            self.extra['peak_memory_bytes'] = max(self.extra.get('peak_memory_bytes', 0), record['peak_memory_bytes'])
+
+    def record(self):
+        record = {
+            'name': self.name,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'wall_seconds': round(time.perf_counter() - self._started, 6),
+            'spans': {name: {'seconds': round(seconds, 6), 'total': round(total, 6), 'calls': calls}
+                      for name, (seconds, total, calls) in self.spans.items()},
+            'counters': dict(sorted(self.counters.items())),
+        }
+        record.update(self.extra)
+        return record
+
+    def emit(self, target='-'):
+        """输出一行 JSON：target 为 - 时写到标准错误，否则追加到文件"""
+        line = json.dumps(self.record(), ensure_ascii=False) + '\n'
+        if not target or target == '-':
+            sys.stderr.write(line)
+        else:
+            with open(target, 'a', encoding='utf-8') as f:
+                f.write(line)
+
+
+class NullMetrics:
+    """未启用统计时使用，各方法不做任何事"""
+
+    enabled = False
+    _null_span = nullcontext()
+
+    def span(self, name):
+        return self._null_span
+
+    def timed_iter(self, name, iterable):
+        return iterable
+
+    def count(self, name, n=1):
+        pass
+
+    def writer(self, f):
+        return f
+
+
+NULL_METRICS = NullMetrics()
+
+
+@contextmanager
+def capture(metrics, cpu_path=None, memory=False, profiler=None):
+    """代码块执行期间可选地启用 cProfile 与 tracemalloc，结果记入 metrics
+
+    cpu_path 为 cProfile 结果文件（可用 python -m pstats 或 snakeviz 查看）；
+    profiler 为已有的 Profile 对象时在其上累计，用于多次调用写入同一文件。
+    """
+    if cpu_path and profiler is None:
+        profiler = cProfile.Profile()
+    tracing = memory and not tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.start()
+    elif memory:
+        tracemalloc.reset_peak()
+    if cpu_path:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if cpu_path:
+            profiler.disable()
+            profiler.dump_stats(cpu_path)
+            metrics.extra['cpu_profile'] = os.path.abspath(cpu_path)
+        if memory:
+            metrics.extra['peak_memory_bytes'] = tracemalloc.get_traced_memory()[1]
+            if tracing:
+                tracemalloc.stop()
+
+
+def metrics_from_env(name):
+    """按环境变量返回 (metrics, 输出目标, cProfile 文件, 是否统计内存)，未启用时 metrics 为 NULL_METRICS"""
+    target = os.environ.get(PROFILE_ENV)
+    cpu_path = os.environ.get(PROFILE_CPU_ENV)
+    memory = os.environ.get(PROFILE_MEMORY_ENV, '') not in ('', '0')
+    if not (target or cpu_path or memory):
+        return NULL_METRICS, None, None, False
+    return Metrics(name), target or '-', cpu_path, memory
@@ -0,0 +1,161 @@
+import glob
+import hashlib
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import batch
+from batch import OPTION_FIELDS, build_user_input, load_manifest
+from sql_spans import open_mapped
+from sqlhelp import SQLHelper, atomic_write, file_hash, GREEN, YELLOW, RED, RESET
+
+# 影响生成结果的源码文件，任一文件变化时全部脚本需要重新生成
+GENERATOR_FILES = (
+    'sqlhelp.py', 'sql_lexer.py', 'sql_spans.py', 'sql_rules.py', 'sql_optimizer.py',
+    'schema_snapshot.py', 'ddl_advisor.py',
+    os.path.join('templates', 'groovy_template.py'), os.path.join('templates', 'guard_template.py'),
+)
+# 生成时用到的配置项
+CONFIG_INPUTS = ('responsible_person', 'root_dir')
+# 取值为文件路径的选项，按文件内容计算输入
+FILE_OPTIONS = ('schema_snapshot', 'table_stats')
+_DATE_RE = re.compile(r'_01_(\d{8})_')
+
+
+def generator_fingerprint(rules):
+    """生成器源码与当前规则集的指纹"""
+    digest = hashlib.sha256()
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    for name in GENERATOR_FILES:
+        digest.update(name.encode('utf-8'))
+        digest.update(file_hash(os.path.join(base_dir, name)).encode('ascii'))
+    for rule in rules.rules:
+        digest.update(repr((rule.name, rule.pattern, rule.guard)).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def row_key(row):
+    """清单行的标识：决定输出文件名的字段"""
+    return '|'.join(str(row[key]) for key in ('database', 'version', 'region', 'requirement_id', 'description'))
+
+
+def row_inputs(row, config_values, fingerprint):
+    """清单行全部输入的哈希：SQL 内容、生成选项、用到的配置项和生成器指纹"""
+    inputs = {
+        'sql': file_hash(row['sql_path']),
+        'fields': {key: row[key] for key in ('database', 'version', 'region', 'requirement_id', 'description')},
+        'options': {key: row.get(key) for key in OPTION_FIELDS if key not in FILE_OPTIONS},
+        'files': {key: file_hash(row[key]) for key in FILE_OPTIONS if row.get(key)},
+        'config': config_values,
+        'generator': fingerprint,
+    }
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def existing_date(helper, user_input):
+    """首次纳入重建时沿用目录中已有同名脚本的日期，避免生成另一个日期的新文件"""
+    dir_path, _ = helper.get_output_dirs(user_input)
+    name = helper.generate_file_name(dict(user_input, date='DATE'))
+    pattern = glob.escape(name).replace('DATE', '[0-9]' * 8) + '.groovy'
+    dates = sorted(_DATE_RE.search(os.path.basename(path)).group(1)
+                   for path in glob.glob(os.path.join(glob.escape(dir_path), pattern)))
+    return dates[-1] if dates else None
+
+
+def _rebuild(row):
+    """在工作进程中重新生成单个脚本，返回 (文件路径列表, 内容未变的文件列表)"""
+    user_input = build_user_input(row)
+    with open_mapped(row['sql_path']) as buffer:
+        user_input['sql'] = buffer
+        file_paths = batch._helper.write_groovy_files(user_input)
+    return file_paths, batch._helper.unchanged_files
+
+
+def load_state(state_path):
+    try:
+        with open(state_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def run_rebuild(manifest_path, config_path='config.json', workers=None, options=None, force=False):
+    """按清单增量重新生成：只处理输入有变化的行，内容相同的文件不重写；返回失败的行数
+
+    每行的输入哈希与输出文件记录在清单旁的 .state.json 中。
+    """
+    config_path = os.path.abspath(config_path)
+    state_path = manifest_path + '.state.json'
+    helper = SQLHelper(config_path)
+    state = load_state(state_path)
+    fingerprint = generator_fingerprint(helper.rules)
+    config_values = {key: getattr(helper.config, key) for key in CONFIG_INPUTS}
+    rows = load_manifest(manifest_path, helper.config.regions[0], options)
+    started = time.perf_counter()
+    failed = skipped = rebuilt = unchanged_files = 0
+    new_state = {}
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=batch._init_worker, initargs=(config_path,)) as pool:
+        futures = {}
+        for line_no, row, error in rows:
+            if error:
+                failed += 1
+                print(f"{RED}[第{line_no}行] 失败：{error}{RESET}")
+                continue
+            key = row_key(row)
+            previous = state.get(key, {})
+            try:
+                inputs = row_inputs(row, config_values, fingerprint)
+            except OSError as e:
+                failed += 1
+                print(f"{RED}[第{line_no}行] 失败：{e}{RESET}")
+                continue
+            row['date'] = (previous.get('date') or existing_date(helper, build_user_input(row))
+                           or datetime.now().strftime('%Y%m%d'))
+            entry = {'inputs': inputs, 'date': row['date'], 'outputs': previous.get('outputs', [])}
+            if (not force and previous.get('inputs') == inputs and entry['outputs']
+                    and all(os.path.exists(path) for path in entry['outputs'])):
+                skipped += 1
+                new_state[key] = entry
+                continue
+            futures[pool.submit(_rebuild, row)] = (line_no, key, entry, previous)
+
+        for future in as_completed(futures):
+            line_no, key, entry, previous = futures[future]
+            try:
+                file_paths, unchanged = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"{RED}[第{line_no}行] 失败：{e}{RESET}")
+                # 保留上次成功的记录，下次重新尝试
+                if previous:
+                    new_state[key] = previous
+                continue
+            rebuilt += 1
+            unchanged_files += len(unchanged)
+            # 拆分数变少等原因不再产生的旧文件
+            for path in set(previous.get('outputs', ())) - set(file_paths):
+                if os.path.exists(path):
+                    os.remove(path)
+            entry['outputs'] = file_paths
+            new_state[key] = entry
+            written = [path for path in file_paths if path not in unchanged]
+            if written:
+                print(f"{GREEN}[第{line_no}行] 已更新：{', '.join(written)}{RESET}")
+            else:
+                print(f"[第{line_no}行] 内容未变，未重写")
+
+    atomic_write(state_path, json.dumps(new_state, ensure_ascii=False, indent=2))
+    elapsed = time.perf_counter() - started
+    color = GREEN if not failed else YELLOW
+    print(f"\n{color}共 {len(rows)} 行：输入未变跳过 {skipped}，重新生成 {rebuilt}"
+          f"（其中 {unchanged_files} 个文件内容未变），失败 {failed}，耗时 {elapsed:.2f}s{RESET}")
+    # 跳过的行也同步，版本目录中被手工改动或删除的文件会恢复
+    if options and options.get('sync'):
+        from version_sync import run_sync, DEFAULT_SYNC_WORKERS
+        failed += run_sync(helper, [path for entry in new_state.values() for path in entry['outputs']],
+                           options.get('sync_workers') or DEFAULT_SYNC_WORKERS)
+    return failed
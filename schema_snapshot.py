@@ -0,0 +1,297 @@
+import json
+import re
+
+from sql_lexer import iter_statements
+from sql_optimizer import split_top_level
+from sql_rules import ALTER_PREFIX_RE, DEFAULT_RULES
+
+# 快照检查结果
+APPLIED = 'applied'                  # 判断不成立，语句在目标库上不会执行
+MISSING_TABLE = 'missing_table'      # 引用的表不存在
+MISSING_COLUMN = 'missing_column'    # 修改的字段不存在，判断不成立导致语句被静默跳过
+STATUS_LABELS = {
+    APPLIED: '已执行',
+    MISSING_TABLE: '表不存在',
+    MISSING_COLUMN: '字段不存在',
+}
+
+_USE_RE = re.compile(r'use\s+`?(\w+)`?\s*$', re.I)
+_CREATE_LIKE_RE = re.compile(
+    r'create\s+table\s+(?:if\s+not\s+exists\s+)?(?:`?\w+`?\s*\.\s*)?`?\w+`?\s*\(?\s*like\s+'
+    r'(?:`?(\w+)`?\s*\.\s*)?`?(\w+)`?', re.I)
+_SELECT_RE = re.compile(r'\bselect\b', re.I)
+_PAREN_TOKEN_RE = re.compile(r"""'(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.|"")*"|`(?:[^`]|``)*`|[()]""", re.S)
+_DROP_TABLE_RE = re.compile(r'drop\s+(?:temporary\s+)?table\s+(?:if\s+exists\s+)?(?:`?(\w+)`?\s*\.\s*)?`?(\w+)`?\s*$',
+                            re.I)
+_CHANGE_TO_RE = re.compile(r'change\s+(?:column\s+)?`?\w+`?\s+`?(\w+)`?', re.I)
+# 建表语句中的定义项：索引/约束，其余为字段
+_INDEX_DEF_RE = re.compile(
+    r'(?:constraint\s+(?:`?(?P<constraint>\w+)`?\s+)?)?'
+    r'(?:(?P<primary>primary\s+key)|(?:unique|fulltext|spatial)(?:\s+(?:index|key))?|index|key'
+    r'|(?P<other>foreign\s+key|check))\s*(?:`?(?P<name>\w+)`?)?', re.I)
+_COLUMN_DEF_RE = re.compile(r'`?(\w+)`?')
+
+
+class TableInfo:
+    """表结构：字段名与索引名（小写）；columns 为 None 表示字段未知（如 CREATE TABLE ... SELECT）"""
+
+    __slots__ = ('columns', 'indexes')
+
+    def __init__(self, columns=(), indexes=()):
+        self.columns = None if columns is None else set(columns)
+        self.indexes = set(indexes)
+
+    def copy(self):
+        return TableInfo(self.columns, self.indexes)
+
+
+def parse_create_table(statement):
+    """解析 CREATE TABLE 语句的字段和索引，无法确定字段时返回字段未知的 TableInfo"""
+    start = statement.find('(')
+    # CREATE TABLE ... [AS] SELECT 的字段取决于查询结果
+    if start < 0 or _SELECT_RE.search(statement, 0, start):
+        return TableInfo(None)
+    depth = 0
+    for m in _PAREN_TOKEN_RE.finditer(statement, start):
+        depth += {'(': 1, ')': -1}.get(m.group(), 0)
+        if depth == 0:
+            end = m.start()
+            break
+    else:
+        return TableInfo(None)
+    if _SELECT_RE.search(statement, end):
+        return TableInfo(None)
+
+    columns = set()
+    indexes = set()
+    for item in split_top_level(statement[start + 1:end]):
+        m = _INDEX_DEF_RE.match(item)
+        if m:
+            if m.group('primary'):
+                indexes.add('primary')
+            elif not m.group('other') and (m.group('name') or m.group('constraint')):
+                indexes.add((m.group('name') or m.group('constraint')).lower())
+            continue
+        m = _COLUMN_DEF_RE.match(item)
+        if m:
+            columns.add(m.group(1).lower())
+    return TableInfo(columns, indexes)
+
+
+class SchemaSnapshot:
+    """离线表结构索引：库名 -> 表名 -> TableInfo，名称均为小写
+
+    未指定库名的表（如不带 --databases 导出的 mysqldump）放在空字符串库下，
+    查找未带库名的语句时先找脚本的数据库，再找空字符串库。
+    """
+
+    def __init__(self):
+        self.schemas = {}
+
+    def add_table(self, schema, table, info):
+        self.schemas.setdefault((schema or '').lower(), {})[table.lower()] = info
+
+    def resolve_schema(self, schema, database):
+        """返回语句所在的库名，快照中没有该库时返回 None（无法判断）"""
+        for name in ((schema,) if schema else (database, '')):
+            if name is not None and name.lower() in self.schemas:
+                return name.lower()
+        return None
+
+    def get_table(self, schema, table):
+        return self.schemas.get(schema, {}).get(table.lower())
+
+    @classmethod
+    def from_dump(cls, source):
+        """从 mysqldump --no-data 的输出构建，source 可以是字符串或文件对象"""
+        snapshot = cls()
+        schema = ''
+        for statement in iter_statements(source):
+            m = _USE_RE.match(statement)
+            if m:
+                schema = m.group(1)
+                continue
+            match = DEFAULT_RULES.classify(statement)
+            if match.kind == 'create_table':
+                snapshot.add_table(match.schema or schema, match.table, parse_create_table(statement))
+            elif match.kind in ('create_index', 'add_index') and match.index:
+                info = snapshot.get_table((match.schema or schema).lower(), match.table)
+                if info:
+                    info.indexes.add(match.index.lower())
+        return snapshot
+
+    @classmethod
+    def from_json(cls, data):
+        """从 JSON 构建，支持两种格式：
+
+        {"库名": {"表名": {"columns": [...], "indexes": [...]}}}；
+        information_schema.COLUMNS/STATISTICS 导出的行列表（含 TABLE_SCHEMA、TABLE_NAME、
+        COLUMN_NAME 或 INDEX_NAME），也可以是 {"任意名称": [行, ...]} 形式的多个列表。
+        """
+        snapshot = cls()
+        if isinstance(data, dict) and all(isinstance(tables, dict) for tables in data.values()):
+            for schema, tables in data.items():
+                for table, info in tables.items():
+                    snapshot.add_table(schema, table, TableInfo(
+                        (name.lower() for name in info.get('columns', ())),
+                        (name.lower() for name in info.get('indexes', ()))))
+            return snapshot
+
+        rows = data if isinstance(data, list) else [row for value in data.values() for row in value]
+        for row in rows:
+            row = {key.lower(): value for key, value in row.items()}
+            schema = row.get('table_schema') or ''
+            table = row['table_name']
+            info = snapshot.get_table(schema.lower(), table)
+            if info is None:
+                info = TableInfo()
+                snapshot.add_table(schema, table, info)
+            if row.get('column_name'):
+                info.columns.add(row['column_name'].lower())
+            if row.get('index_name'):
+                info.indexes.add(row['index_name'].lower())
+        return snapshot
+
+    @classmethod
+    def load(cls, path):
+        """按扩展名读取快照文件：.json 为 JSON，其他按 mysqldump 输出处理"""
+        with open(path, 'r', encoding='utf-8') as f:
+            if path.lower().endswith('.json'):
+                return cls.from_json(json.load(f))
+            return cls.from_dump(f)
+
+
+class SnapshotChecker:
+    """按脚本顺序模拟执行：检查每条语句在快照上的效果，并把其结构变更应用到快照副本上"""
+
+    def __init__(self, snapshot, database, rules=DEFAULT_RULES):
+        self.snapshot = snapshot
+        self.database = database
+        self.rules = rules
+        self._tables = {}  # 脚本修改过的表：(库名, 表名) -> TableInfo 副本，None 表示已删除
+
+    def _lookup(self, schema, table):
+        key = (schema, table.lower())
+        if key in self._tables:
+            return self._tables[key]
+        return self.snapshot.get_table(schema, table)
+
+    def _modify(self, schema, table):
+        key = (schema, table.lower())
+        if key not in self._tables:
+            info = self.snapshot.get_table(schema, table)
+            self._tables[key] = info.copy() if info else None
+        return self._tables[key]
+
+    def evaluate(self, match):
+        """返回语句在当前结构上的检查结果，无问题或无法判断时返回 None"""
+        if not match.table:
+            return None
+        schema = self.snapshot.resolve_schema(match.schema, self.database)
+        if schema is None:
+            return None
+        info = self._lookup(schema, match.table)
+        if match.kind == 'create_table':
+            return APPLIED if info else None
+        if info is None:
+            return MISSING_TABLE
+        index = (match.index or '').lower()
+        column = (match.column or '').lower()
+        if match.kind in ('create_index', 'add_index'):
+            return APPLIED if index in info.indexes else None
+        if match.kind in ('drop_index', 'drop_index_on'):
+            return APPLIED if index not in info.indexes else None
+        if info.columns is None:
+            return None
+        if match.kind == 'add_column':
+            return APPLIED if column in info.columns else None
+        if match.kind == 'drop_column':
+            return APPLIED if column not in info.columns else None
+        if match.kind in ('modify_column', 'change_column'):
+            return MISSING_COLUMN if column not in info.columns else None
+        return None
+
+    def _apply_clause(self, match, statement, schema):
+        info = self._modify(schema, match.table)
+        if info is None:
+            return
+        index = (match.index or '').lower()
+        column = (match.column or '').lower()
+        if match.kind in ('create_index', 'add_index'):
+            info.indexes.add(index)
+        elif match.kind in ('drop_index', 'drop_index_on'):
+            info.indexes.discard(index)
+        elif info.columns is None:
+            return
+        elif match.kind == 'add_column':
+            info.columns.add(column)
+        elif match.kind == 'drop_column':
+            info.columns.discard(column)
+        elif match.kind == 'change_column':
+            m = _CHANGE_TO_RE.search(statement)
+            if m:
+                info.columns.discard(column)
+                info.columns.add(m.group(1).lower())
+
+    def apply(self, match, statement):
+        """把语句的结构变更应用到快照副本（多子句 ALTER 逐个子句应用）"""
+        m = _DROP_TABLE_RE.match(statement)
+        if m:
+            schema = self.snapshot.resolve_schema(m.group(1), self.database)
+            if schema is not None:
+                self._tables[(schema, m.group(2).lower())] = None
+            return
+        if not match.table:
+            return
+        schema = self.snapshot.resolve_schema(match.schema, self.database)
+        if schema is None:
+            return
+        if match.kind == 'create_table':
+            if self._lookup(schema, match.table) is None:
+                like = _CREATE_LIKE_RE.match(statement)
+                if like:
+                    source = self._lookup(self.snapshot.resolve_schema(like.group(1), self.database) or schema,
+                                          like.group(2))
+                    info = source.copy() if source else TableInfo(None)
+                else:
+                    info = parse_create_table(statement)
+                self._tables[(schema, match.table.lower())] = info
+            return
+        prefix = ALTER_PREFIX_RE.match(statement)
+        if not prefix:
+            self._apply_clause(match, statement, schema)
+            return
+        head = statement[:prefix.end()]
+        for clause in split_top_level(statement[prefix.end():]):
+            clause_statement = head + clause
+            clause_match = self.rules.classify(clause_statement)
+            if clause_match.kind:
+                self._apply_clause(clause_match, clause_statement, schema)
+
+
+def check_against_snapshot(sql_metas, snapshot, database, rules=DEFAULT_RULES, drop_applied=False,
+                           findings=None, stats=None):
+    """对照快照检查每条语句：已执行的语句可删除，引用不存在的表/字段的语句记录到 findings
+
+    findings 传入列表时追加 (语句序号, 检查结果, 语句)；stats 记录各类结果的条数。
+    """
+    checker = SnapshotChecker(snapshot, database, rules)
+    counts = dict.fromkeys(STATUS_LABELS, 0)
+    dropped = 0
+    for number, (check_sql, statement) in enumerate(sql_metas, 1):
+        text = str(statement)
+        match = rules.classify(text)
+        status = checker.evaluate(match)
+        checker.apply(match, text)
+        if status:
+            counts[status] += 1
+            if findings is not None:
+                findings.append((number, status, text))
+            if status == APPLIED and drop_applied:
+                dropped += 1
+                continue
+        yield check_sql, statement
+
+    if stats is not None:
+        stats.update(('snapshot_' + status, count) for status, count in counts.items())
+        stats['snapshot_dropped'] = dropped
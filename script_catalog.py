@@ -0,0 +1,249 @@
+import hashlib
+import os
+import re
+import sqlite3
+import time
+
+from sql_optimizer import split_top_level
+from sql_rules import ALTER_PREFIX_RE, DEFAULT_RULES
+from sqlhelp import GREEN, YELLOW, RESET
+
+SCRIPT_DIR_NAME = '01.数据库脚本'
+DEFAULT_CATALOG_NAME = 'sqlhelp_catalog.db'
+# 索引结构版本，结构变化时旧索引整体重建
+CATALOG_VERSION = 2
+
+_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    root TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    version TEXT,
+    region TEXT,
+    database TEXT,
+    requirement_id TEXT,
+    change_id TEXT
+);
+CREATE TABLE IF NOT EXISTS touches (
+    path TEXT NOT NULL REFERENCES files(path) ON DELETE CASCADE,
+    kind TEXT,
+    schema_name TEXT,
+    table_name TEXT,
+    column_name TEXT,
+    index_name TEXT,
+    definition TEXT
+);
+CREATE INDEX IF NOT EXISTS files_requirement ON files(requirement_id);
+CREATE INDEX IF NOT EXISTS files_database ON files(database);
+CREATE INDEX IF NOT EXISTS files_hash ON files(sha256);
+CREATE INDEX IF NOT EXISTS touches_path ON touches(path);
+CREATE INDEX IF NOT EXISTS touches_column ON touches(schema_name, table_name, column_name);
+CREATE INDEX IF NOT EXISTS touches_index ON touches(schema_name, table_name, index_name);
+"""
+
+_DATABASE_RE = re.compile(r'String getDatabase\(\)\s*\{\s*return "([^"]*)"')
+_CHANGE_ID_RE = re.compile(r'String getChangeId\(\)\s*\{\s*return "([^"]*)"')
+_STATEMENT_RE = re.compile(r"SqlMeta\.build\(\"(?:[^\"\\]|\\.)*\", ''' (.*?); '''\)", re.S)
+# 子句中字段/索引名之后的定义部分
+_DEFINITION_RE = re.compile(
+    r'(?:add|modify|change|drop)\s+(?:(?:column|unique|fulltext|spatial|index|key)\s+)*`?\w+`?\s*(.*)', re.I | re.S)
+_INDEX_COLUMNS_RE = re.compile(r'\bon\s+(?:`?\w+`?\s*\.\s*)?`?\w+`?\s*(.*)', re.I | re.S)
+# 文件名中需求号之后的部分：_序号_日期_
+_NAME_TAIL_RE = re.compile(r'_\d{2}_\d{8}_')
+
+
+def parse_script_path(path):
+    """从 .../{版本号}/01.数据库脚本/{区划}/{库}/文件 中取出 (版本号, 区划)"""
+    parts = os.path.normpath(path).split(os.sep)
+    if SCRIPT_DIR_NAME in parts:
+        i = len(parts) - 1 - parts[::-1].index(SCRIPT_DIR_NAME)
+        if 0 < i and i + 1 < len(parts) - 1:
+            return parts[i - 1], parts[i + 1]
+    return None, None
+
+
+def parse_requirement_id(file_name, database):
+    """文件名 DB_{库名大写}_{需求号}_{序号}_{日期}_{说明}.groovy 中的需求号（去掉 #）"""
+    prefix = f"DB_{database.upper()}_"
+    if not file_name.upper().startswith(prefix):
+        return None
+    rest = file_name[len(prefix):]
+    m = _NAME_TAIL_RE.search(rest)
+    if not m:
+        return None
+    return rest[:m.start()].lstrip('#')
+
+
+def normalize_definition(text):
+    """定义部分去掉反引号、合并空白，用于比较两处定义是否一致"""
+    return ' '.join(text.replace('`', '').split())
+
+
+def iter_touches(content, database=None, rules=DEFAULT_RULES):
+    """逐条产出脚本中语句涉及的 (类型, 库名, 表名, 字段名, 索引名, 定义)，多子句 ALTER 逐个子句产出
+
+    未指定库名的语句归入脚本的数据库 database，名称均为小写。
+    """
+    for m in _STATEMENT_RE.finditer(content):
+        statement = m.group(1).strip()
+        prefix = ALTER_PREFIX_RE.match(statement)
+        if prefix:
+            head = statement[:prefix.end()]
+            clauses = [(head, clause) for clause in split_top_level(statement[prefix.end():])]
+        else:
+            clauses = [('', statement)]
+        for head, clause in clauses:
+            match = rules.classify(head + clause)
+            if not match.table:
+                continue
+            if head:
+                definition = _DEFINITION_RE.match(clause)
+            elif match.kind == 'create_index':
+                definition = _INDEX_COLUMNS_RE.search(clause)
+            else:
+                definition = None
+            yield (match.kind, (match.schema or database or '').lower(), match.table.lower(),
+                   (match.column or '').lower() or None, (match.index or '').lower() or None,
+                   normalize_definition(definition.group(1)) if definition else None)
+
+
+def iter_script_files(root):
+    """递归列出 root 下的 .groovy 文件，返回 (路径, stat)"""
+    stack = [root]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.endswith('.groovy') and entry.is_file():
+                    yield entry.path, entry.stat()
+
+
+class ScriptCatalog:
+    """已生成脚本的 SQLite 索引：文件的需求号、库、版本、区划、涉及的表/字段以及内容哈希"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute('PRAGMA foreign_keys = ON')
+        self.conn.execute('PRAGMA journal_mode = WAL')
+        if self.conn.execute('PRAGMA user_version').fetchone()[0] != CATALOG_VERSION:
+            self.conn.executescript('DROP TABLE IF EXISTS touches; DROP TABLE IF EXISTS files;')
+            self.conn.execute(f'PRAGMA user_version = {CATALOG_VERSION}')
+        self.conn.executescript(_SCHEMA_SQL)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _index_file(self, path, root, stat):
+        with open(path, 'rb') as f:
+            data = f.read()
+        content = data.decode('utf-8', errors='replace')
+        m = _DATABASE_RE.search(content)
+        database = m.group(1) if m else None
+        m = _CHANGE_ID_RE.search(content)
+        change_id = m.group(1) if m else None
+        version, region = parse_script_path(path)
+        requirement_id = parse_requirement_id(os.path.basename(path), database) if database else None
+
+        self.conn.execute('DELETE FROM files WHERE path = ?', (path,))
+        self.conn.execute(
+            'INSERT INTO files (path, root, mtime_ns, size, sha256, version, region, database, requirement_id, change_id) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (path, root, stat.st_mtime_ns, stat.st_size, hashlib.sha256(data).hexdigest(),
+             version, region, database, requirement_id, change_id))
+        self.conn.executemany(
+            'INSERT INTO touches (path, kind, schema_name, table_name, column_name, index_name, definition) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            ((path,) + touch for touch in iter_touches(content, database)))
+
+    def refresh(self, roots):
+        """按修改时间和大小增量更新 roots 下的全部脚本，返回 (新增或更新数, 删除数)"""
+        updated = removed = 0
+        scanned = []
+        with self.conn:
+            for root in sorted(os.path.abspath(root) for root in roots if root):
+                # 嵌套在已扫描目录中的目录不再单独扫描，避免同一文件归属两个根目录
+                if any(root == parent or root.startswith(parent + os.sep) for parent in scanned):
+                    continue
+                scanned.append(root)
+                known = {path: (mtime, size) for path, mtime, size in
+                         self.conn.execute('SELECT path, mtime_ns, size FROM files WHERE root = ?', (root,))}
+                for path, stat in iter_script_files(root):
+                    if known.pop(path, None) != (stat.st_mtime_ns, stat.st_size):
+                        self._index_file(path, root, stat)
+                        updated += 1
+                if known:
+                    self.conn.executemany('DELETE FROM files WHERE path = ?', ((path,) for path in known))
+                    removed += len(known)
+        return updated, removed
+
+    def add_files(self, paths, root):
+        """生成脚本后直接登记，无需重新扫描目录"""
+        root = os.path.abspath(root)
+        with self.conn:
+            for path in paths:
+                path = os.path.abspath(path)
+                self._index_file(path, root, os.stat(path))
+
+    def find(self, requirement_id=None, database=None, version=None, region=None, table=None, column=None):
+        """按条件查询，返回 [(路径, 需求号, 库, 版本号, 区划, 涉及的表.字段列表)]；表名、字段名不区分大小写"""
+        where = []
+        params = []
+        for name, value in (('f.requirement_id', requirement_id), ('f.database', database),
+                            ('f.version', version), ('f.region', region)):
+            if value:
+                where.append(f'{name} = ? COLLATE NOCASE')
+                params.append(value.lstrip('#') if name == 'f.requirement_id' else value)
+        if table or column:
+            conditions = []
+            if table:
+                conditions.append('t.table_name = ?')
+                params.append(table.lower())
+            if column:
+                conditions.append('t.column_name = ?')
+                params.append(column.lower())
+            where.append('EXISTS (SELECT 1 FROM touches t WHERE t.path = f.path AND ' + ' AND '.join(conditions) + ')')
+        sql = ('SELECT f.path, f.requirement_id, f.database, f.version, f.region, '
+               "(SELECT GROUP_CONCAT(DISTINCT t.table_name || IFNULL('.' || t.column_name, '')) "
+               'FROM touches t WHERE t.path = f.path) '
+               'FROM files f')
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY f.version, f.path'
+        return self.conn.execute(sql, params).fetchall()
+
+
+def default_catalog_path(config_path):
+    """索引文件默认放在配置文件旁边"""
+    return os.path.join(os.path.dirname(os.path.abspath(config_path)), DEFAULT_CATALOG_NAME)
+
+
+def run_find(catalog_path, roots, filters, refresh=True):
+    """sqlhelp find：先增量更新索引，再按条件查询并打印，返回匹配的文件数"""
+    started = time.perf_counter()
+    with ScriptCatalog(catalog_path) as catalog:
+        if refresh:
+            updated, removed = catalog.refresh(roots)
+            if updated or removed:
+                print(f"{YELLOW}索引已更新：{updated} 个文件新增或修改，{removed} 个文件删除{RESET}")
+        rows = catalog.find(**filters)
+    for path, requirement_id, database, version, region, touches in rows:
+        print(f"{GREEN}{path}{RESET}")
+        print(f"    需求号 {requirement_id or '-'}  库 {database or '-'}  版本 {version or '-'}  区划 {region or '-'}")
+        if touches:
+            print(f"    涉及 {touches.replace(',', ', ')}")
+    print(f"\n共 {len(rows)} 个文件，耗时 {(time.perf_counter() - started) * 1000:.0f} ms")
+    return len(rows)
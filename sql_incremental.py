@@ -0,0 +1,136 @@
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+
+from sql_lexer import DEFAULT_DELIMITER, SqlLexer, iter_lines_from
+
+DEFAULT_CACHE_SIZE = 100000
+# 比较公共前缀/后缀时每次比较的块大小
+_BLOCK = 4096
+
+
+def common_prefix(a, b):
+    """a、b 公共前缀的长度，按块比较"""
+    limit = min(len(a), len(b))
+    pos = 0
+    while pos < limit and a[pos:pos + _BLOCK] == b[pos:pos + _BLOCK]:
+        pos += _BLOCK
+    pos = min(pos, limit)
+    stop = min(pos + _BLOCK, limit)
+    while pos < stop and a[pos] == b[pos]:
+        pos += 1
+    return pos
+
+
+def common_suffix(a, b, limit):
+    """a、b 公共后缀的长度，最多 limit 个字符"""
+    size = 0
+    while size < limit:
+        step = min(_BLOCK, limit - size)
+        if a[len(a) - size - step:len(a) - size] != b[len(b) - size - step:len(b) - size]:
+            break
+        size += step
+    stop = min(size + _BLOCK, limit)
+    while size < stop and a[len(a) - size - 1] == b[len(b) - size - 1]:
+        size += 1
+    return size
+
+
+class IncrementalAnalyzer:
+    """增量分析：记录语句边界，编辑后只重新切分变化的区域，其余语句直接复用
+
+    analyze 为 语句 -> (判断SQL, 语句) 的函数，结果按语句文本做 LRU 缓存，
+    hits/misses 为缓存命中与未命中次数，reused 为未重新切分而直接复用的语句数。
+    """
+
+    def __init__(self, analyze, cache_size=DEFAULT_CACHE_SIZE):
+        self.analyze = analyze
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.reused = 0
+        self.reset()
+
+    def reset(self):
+        """清空语句边界（保留缓存）"""
+        self._text = ''
+        self._ends = []        # 每条语句分隔符之后的位置
+        self._delimiters = []  # 该位置之后生效的分隔符
+        self._metas = []
+        self._open_tail = False  # 最后一条语句没有分隔符
+
+    @property
+    def sql_metas(self):
+        return self._metas
+
+    @property
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'reused': self.reused, 'cached': len(self._cache)}
+
+    def _lookup(self, statement):
+        meta = self._cache.get(statement)
+        if meta is None:
+            self.misses += 1
+            meta = self._cache[statement] = self.analyze(statement)
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        else:
+            self.hits += 1
+            self._cache.move_to_end(statement)
+        return meta
+
+    def update(self, text):
+        """用编辑后的全文更新分析结果，返回 sql_metas 列表"""
+        old = self._text
+        prefix = common_prefix(old, text)
+        suffix = common_suffix(old, text, min(len(old), len(text)) - prefix)
+        delta = len(text) - len(old)
+        changed_end = len(text) - suffix
+
+        # 从变化位置之前最后一个语句边界开始重新切分
+        closed = len(self._ends) - (1 if self._open_tail else 0)
+        keep = bisect_right(self._ends, prefix, 0, closed)
+        start = self._ends[keep - 1] if keep else 0
+        lexer = SqlLexer(self._delimiters[keep - 1] if keep else DEFAULT_DELIMITER)
+
+        ends, delimiters, metas = [], [], []
+        synced = None
+        offset = start
+        for line in iter_lines_from(text, start):
+            line_start = offset == 0 or text[offset - 1] == '\n'
+            for statement, end in lexer.feed_with_ends(line, line_start):
+                end += offset
+                ends.append(end)
+                delimiters.append(lexer.delimiter)
+                metas.append(self._lookup(statement))
+                # 越过变化区域后，遇到与旧结果相同的边界即可停止
+                if end >= changed_end:
+                    i = bisect_left(self._ends, end - delta, keep, closed)
+                    if i < closed and self._ends[i] == end - delta and self._delimiters[i] == lexer.delimiter:
+                        synced = i
+                        break
+            if synced is not None:
+                break
+            offset += len(line)
+
+        if synced is not None:
+            tail = synced + 1
+            self.reused += keep + len(self._metas) - tail
+            self._ends = self._ends[:keep] + ends + [end + delta for end in self._ends[tail:]]
+            self._delimiters = self._delimiters[:keep] + delimiters + self._delimiters[tail:]
+            self._metas = self._metas[:keep] + metas + self._metas[tail:]
+        else:
+            self.reused += keep
+            open_tail = False
+            for statement in lexer.close():
+                ends.append(len(text))
+                delimiters.append(lexer.delimiter)
+                metas.append(self._lookup(statement))
+                open_tail = True
+            self._ends = self._ends[:keep] + ends
+            self._delimiters = self._delimiters[:keep] + delimiters
+            self._metas = self._metas[:keep] + metas
+            self._open_tail = open_tail
+
+        self._text = text
+        return self._metas
@@ -0,0 +1,184 @@
+import re
+
+DEFAULT_DELIMITER = ';'
+
+# 空白只按 ASCII 判断（与 MySQL 一致），按字节切分时结果也相同
+_WHITESPACE = ' \t\n\r\f\v'
+# DELIMITER 命令，仅在语句起始处识别（与 mysql 客户端一致）
+_DELIMITER_RE = re.compile(r'\s*delimiter\s+(\S+)', re.I | re.A)
+# 引号/反引号内部：转义序列、双写引号、结束引号
+_QUOTE_END_RE = {
+    "'": re.compile(r"\\.|''|'", re.S),
+    '"': re.compile(r'\\.|""|"', re.S),
+    '`': re.compile(r'``|`'),
+}
+_BLOCK_END_RE = re.compile(r'\*/')
+
+# 词法状态
+NORMAL, QUOTE, COMMENT, HINT = range(4)
+
+
+def _compile_pattern(delimiter):
+    """普通状态下需要关注的记号：引号、注释起始、语句分隔符"""
+    return re.compile(r"['\"`]|--(?=\s|$)|#|/\*|" + re.escape(delimiter), re.A)
+
+
+class SqlLexer:
+    """增量 SQL 词法分析器：逐行喂入文本，按分隔符切出完整语句
+
+    识别单/双引号字符串、反引号标识符、--/#/块注释以及 DELIMITER 命令，
+    只保留当前未完成语句的内容，内存占用与输入总大小无关。
+    普通注释会被剔除，/*! */ 与 /*+ */ 形式的版本注释和优化器提示会保留。
+    """
+
+    def __init__(self, delimiter=DEFAULT_DELIMITER):
+        self.delimiter = delimiter
+        self._pattern = _compile_pattern(delimiter)
+        self._state = NORMAL
+        self._quote = None
+        self._parts = []
+        self._started = False
+
+    @property
+    def idle(self):
+        """处于两条语句之间，此时可以识别 DELIMITER 命令"""
+        return self._state == NORMAL and not self._started
+
+    def _append(self, text):
+        if text:
+            self._parts.append(text)
+            if not self._started and text.strip(_WHITESPACE):
+                self._started = True
+
+    def _emit(self):
+        statement = ''.join(self._parts).strip(_WHITESPACE)
+        self._parts = []
+        self._started = False
+        return statement
+
+    def feed(self, line, line_start=True):
+        """喂入一行文本（含换行符），返回该行内已结束的语句列表"""
+        return [statement for statement, _ in self.feed_with_ends(line, line_start)]
+
+    def feed_with_ends(self, line, line_start=True):
+        """同 feed，但返回 [(语句, 分隔符之后在该行中的位置)]
+
+        line_start 为 False 表示 line 是从一行中间开始的片段，此时不识别 DELIMITER 命令。
+        """
+        statements = []
+        pos = 0
+        end = len(line)
+
+        # DELIMITER 命令独占一行，且只在两条语句之间出现
+        if line_start and self.idle:
+            m = _DELIMITER_RE.match(line)
+            if m:
+                self.delimiter = m.group(1)
+                self._pattern = _compile_pattern(self.delimiter)
+                self._parts = []
+                return statements
+
+        while pos < end:
+            if self._state == NORMAL:
+                m = self._pattern.search(line, pos)
+                if not m:
+                    self._append(line[pos:])
+                    break
+                token = m.group()
+                self._append(line[pos:m.start()])
+                pos = m.end()
+                if token == self.delimiter:
+                    statement = self._emit()
+                    if statement:
+                        statements.append((statement, pos))
+                elif token in _QUOTE_END_RE:
+                    self._append(token)
+                    self._state = QUOTE
+                    self._quote = token
+                elif token == '/*':
+                    if line.startswith(('!', '+'), pos):
+                        # 版本注释与优化器提示属于语句的一部分
+                        self._append(token)
+                        self._state = HINT
+                    else:
+                        self._append(' ')
+                        self._state = COMMENT
+                else:
+                    # 行注释：跳到行尾，换行符照常保留
+                    newline = line.find('\n', pos)
+                    pos = end if newline < 0 else newline
+
+            elif self._state == QUOTE:
+                regex = _QUOTE_END_RE[self._quote]
+                scan = pos
+                while True:
+                    m = regex.search(line, scan)
+                    if not m:
+                        self._append(line[pos:])
+                        pos = end
+                        break
+                    scan = m.end()
+                    if m.group() == self._quote:
+                        self._append(line[pos:scan])
+                        self._state = NORMAL
+                        self._quote = None
+                        pos = scan
+                        break
+
+            else:
+                m = _BLOCK_END_RE.search(line, pos)
+                stop = end if not m else m.end()
+                if self._state == HINT:
+                    self._append(line[pos:stop])
+                if m:
+                    self._state = NORMAL
+                pos = stop
+
+        return statements
+
+    def close(self):
+        """输入结束，返回最后一条缺少分隔符的语句（如有）"""
+        statement = self._emit()
+        self._state = NORMAL
+        self._quote = None
+        return [statement] if statement else []
+
+
+def iter_lines_from(text, pos=0):
+    """从 text 的 pos 处开始逐行产出，不复制整个字符串"""
+    end = len(text)
+    while pos < end:
+        newline = text.find('\n', pos)
+        stop = end if newline < 0 else newline + 1
+        yield text[pos:stop]
+        pos = stop
+
+
+def iter_lines(source):
+    """将字符串或按块产出文本的可迭代对象（如文件对象）统一切成带换行符的行"""
+    if isinstance(source, str):
+        yield from iter_lines_from(source)
+        return
+    carry = ''
+    for chunk in source:
+        if carry:
+            chunk = carry + chunk
+            carry = ''
+        start = 0
+        while True:
+            newline = chunk.find('\n', start)
+            if newline < 0:
+                carry = chunk[start:]
+                break
+            yield chunk[start:newline + 1]
+            start = newline + 1
+    if carry:
+        yield carry
+
+
+def iter_statements(source, delimiter=DEFAULT_DELIMITER):
+    """逐条产出 SQL 语句（不含分隔符），source 可以是字符串、文件对象或文本块迭代器"""
+    lexer = SqlLexer(delimiter)
+    for line in iter_lines(source):
+        yield from lexer.feed(line)
+    yield from lexer.close()
@@ -0,0 +1,568 @@
+import re
+
+from sql_rules import ALTER_PREFIX_RE, DEFAULT_RULES
+from templates.guard_template import (
+    GROUP_CONCAT_SETUP_SQL, TABLE_PREFETCH_SQL,
+    CACHED_COLUMN_NOT_EXISTS, CACHED_COLUMN_EXISTS, CACHED_INDEX_NOT_EXISTS, CACHED_INDEX_EXISTS
+)
+
+# 可以合并进同一条 ALTER TABLE 的语句类型：判断为"不存在"，执行后判断不再成立，
+# 合并语句之后补上的原语句在合并语句执行过时不会重复执行（MODIFY COLUMN 执行后判断仍成立，不合并）
+MERGEABLE_KINDS = ('add_column', 'add_index')
+# 显式指定了 ALGORITHM/LOCK 的语句保持原样，避免合并后选项冲突
+_ALTER_OPTION_RE = re.compile(r'\b(?:algorithm|lock)\s*=', re.I)
+_SELECT_RE = re.compile(r'^\s*select\s+', re.I)
+
+
+def combine_guards(guards):
+    """把多个 SELECT [NOT] EXISTS(...) 判断合并为一个，全部成立时才执行"""
+    if len(guards) == 1:
+        return guards[0]
+    return 'SELECT ' + ' AND '.join(f"({_SELECT_RE.sub('', guard)})" for guard in guards)
+
+
+def _merge(group, rules):
+    """把一组同表 ALTER 合并为一条，产出合并后的 (判断SQL, 语句) 及其后补执行的原语句
+
+    合并语句的判断要求全部子句都未执行；部分子句已执行时合并语句跳过，
+    由其后的原语句按各自的判断补执行，合并语句执行过时原语句的判断不成立，不会重复执行。
+    原语句的判断不读取表级缓存（合并语句执行后缓存已过期）。
+    """
+    if len(group) == 1:
+        yield group[0]
+        return
+    first = group[0][1]
+    header = first[:ALTER_PREFIX_RE.match(first).end()].rstrip()
+    clauses = [statement[ALTER_PREFIX_RE.match(statement).end():].strip() for _, statement in group]
+    statement = header + '\n    ' + ',\n    '.join(clauses)
+    yield combine_guards([check_sql for check_sql, _ in group]), statement
+    for check_sql, statement in group:
+        if _CACHED_VAR_RE.search(check_sql):
+            check_sql = rules.classify(statement).check_sql
+        yield AnnotatedMeta(check_sql, statement, '合并语句未执行时补执行')
+
+
+def coalesce_alters(sql_metas, rules=DEFAULT_RULES, stats=None):
+    """合并连续的、作用于同一张表的 ADD COLUMN 与 ADD INDEX 为一条 ALTER TABLE
+
+    MySQL 5.7 每条 ALTER 都可能重建整张表，合并后只重建一次。
+    合并语句之后保留各原语句（带各自的判断），部分子句已执行过、合并语句被跳过时逐条补执行。
+    同一字段在一组内再次出现时另起一组，保证语义不变；
+    本身已包含多个子句的语句无法确定涉及的字段，保持原样。
+    stats 传入字典时记录合并前后的 ALTER 条数。
+    """
+    group = []
+    table = None
+    columns = set()
+    merged = batches = 0
+    for check_sql, statement in sql_metas:
+        match = rules.classify(statement)
+        mergeable = (match.kind in MERGEABLE_KINDS and check_sql
+                     and not _ALTER_OPTION_RE.search(statement)
+                     and not _has_top_level_comma(statement))
+        key = ((match.schema or '').lower(), (match.table or '').lower())
+        column = (match.column or '').lower()
+
+        if group and not (mergeable and key == table and column not in columns):
+            yield from _merge(group, rules)
+            batches += 1
+            group = []
+            columns = set()
+
+        if mergeable:
+            group.append((check_sql, statement))
+            table = key
+            merged += 1
+            if column:
+                columns.add(column)
+        else:
+            yield check_sql, statement
+
+    if group:
+        yield from _merge(group, rules)
+        batches += 1
+
+    if stats is not None:
+        stats['alter_statements'] = merged
+        stats['alter_batches'] = batches
+
+
+# INSERT ... VALUES 的头部：目标表与可选字段列表
+_INSERT_HEAD_RE = re.compile(
+    r'(?:insert|replace)\s+(?:(?:low_priority|delayed|high_priority|ignore)\s+)*(?:into\s+)?'
+    r'(?:`?\w+`?\s*\.\s*)?`?\w+`?\s*(?:\([^()]*\)\s*)?values?\s*', re.I)
+# VALUES 列表中需要关注的记号：字符串、括号、逗号
+_ROW_TOKEN_RE = re.compile(r"""'(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.|"")*"|`(?:[^`]|``)*`|[(),]""", re.S)
+
+# Groovy 编译后的字符串常量不能超过 65535 字节，合并后的 INSERT 须留出余量
+DEFAULT_INSERT_BATCH_BYTES = 60000
+
+
+def count_value_rows(values):
+    """统计 VALUES 后面的行数；存在行以外的内容（如 ON DUPLICATE KEY UPDATE）时返回 None"""
+    depth = 0
+    rows = 0
+    pos = 0
+    expect_row = True
+    for m in _ROW_TOKEN_RE.finditer(values):
+        if depth == 0 and values[pos:m.start()].strip():
+            return None
+        token = m.group()
+        if token == '(':
+            if depth == 0:
+                if not expect_row:
+                    return None
+                expect_row = False
+            depth += 1
+        elif token == ')':
+            depth -= 1
+            if depth < 0:
+                return None
+            if depth == 0:
+                rows += 1
+        elif token == ',':
+            if depth == 0:
+                if expect_row:
+                    return None
+                expect_row = True
+        elif depth == 0:
+            return None
+        pos = m.end()
+    if depth or expect_row or values[pos:].strip():
+        return None
+    return rows
+
+
+def _merge_inserts(group):
+    head, values = group[0]
+    if len(group) == 1:
+        return "", head + values
+    return "", head.rstrip() + '\n' + ',\n'.join(values for _, values in group)
+
+
+def batch_inserts(sql_metas, max_rows, max_bytes=DEFAULT_INSERT_BATCH_BYTES, stats=None):
+    """把连续的、目标表与字段列表相同的单行 INSERT 合并为多行 INSERT
+
+    每批最多 max_rows 行、max_bytes 字节（UTF-8）。带判断条件的语句、
+    INSERT ... SELECT 与 ON DUPLICATE KEY UPDATE 等保持原样。
+    stats 传入字典时记录合并前后的 INSERT 条数。
+    """
+    group = []
+    group_key = None
+    group_rows = 0
+    group_bytes = 0
+    merged = batches = 0
+
+    for meta in sql_metas:
+        check_sql, statement = meta
+        head = _INSERT_HEAD_RE.match(statement) if not check_sql else None
+        rows = None
+        if head:
+            values = statement[head.end():]
+            rows = count_value_rows(values)
+
+        if rows is None:
+            if group:
+                yield _merge_inserts(group)
+                batches += 1
+                group = []
+            yield meta
+            continue
+
+        key = ' '.join(head.group().split())
+        size = len(values.encode('utf-8'))
+        if group and (key != group_key or group_rows + rows > max_rows or group_bytes + size > max_bytes):
+            yield _merge_inserts(group)
+            batches += 1
+            group = []
+        if not group:
+            group_key = key
+            group_rows = group_bytes = 0
+        group.append((statement[:head.end()], values))
+        group_rows += rows
+        group_bytes += size
+        merged += 1
+
+    if group:
+        yield _merge_inserts(group)
+        batches += 1
+
+    if stats is not None:
+        stats['insert_statements'] = merged
+        stats['insert_batches'] = batches
+
+
+# 单表 DELETE/UPDATE，表名后允许的内容由 _top_level_keywords 进一步检查
+_DELETE_RE = re.compile(r'(delete\s+(?:(?:low_priority|quick|ignore)\s+)*from\s+((?:`?\w+`?\s*\.\s*)?`?\w+`?))(?:\s+|$)', re.I)
+_UPDATE_RE = re.compile(r'(update\s+(?:(?:low_priority|ignore)\s+)*((?:`?\w+`?\s*\.\s*)?`?\w+`?)\s+set)\s', re.I)
+# 语句顶层（不在字符串、括号内）需要识别的关键字
+_KEYWORD_TOKEN_RE = re.compile(
+    r"""'(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.|"")*"|`(?:[^`]|``)*`|[()]|\b(?:where|limit|order\s+by|join|using)\b""",
+    re.I | re.S)
+# UPDATE 分批时能证明"更新后不再满足条件"的写法：SET 字段 = 常量，WHERE 中对该字段与常量比较
+_LITERAL = r"""-?\d+|'(?:[^'\\]|\\.|'')*'|null"""
+_COLUMN = r'(?:`?\w+`?\s*\.\s*)?`?(\w+)`?'
+_ASSIGNMENT_RE = re.compile(rf'{_COLUMN}\s*=\s*({_LITERAL})', re.I | re.S)
+_COMPARISON_RE = re.compile(rf'{_COLUMN}\s*(<=>|!=|<>|<=|>=|=|<|>)\s*({_LITERAL})', re.I | re.S)
+_IN_RE = re.compile(rf'{_COLUMN}\s+(not\s+)?in\s*\((.*)\)', re.I | re.S)
+_IS_NULL_RE = re.compile(rf'{_COLUMN}\s+is\s+(not\s+)?null', re.I | re.S)
+# WHERE 条件顶层的 AND 以及使其不再是简单"与"条件的运算符
+_CONDITION_TOKEN_RE = re.compile(
+    r"""'(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.|"")*"|`(?:[^`]|``)*`|[()]|&&|\|\||\b(?:and|or|xor|between)\b""",
+    re.I | re.S)
+
+DEFAULT_DML_MAX_BATCHES = 200
+# 分批执行达到最大批数后仍有剩余的行时执行：子查询返回多行使语句报错、脚本失败，语句文本即为说明
+REMAINING_ROWS_ERROR_SQL = "DO (SELECT '{message}' UNION ALL SELECT '{message}')"
+REMAINING_ROWS_MESSAGE = '分批执行 {times} 批后仍有剩余的行，请确认后手动处理或调大最大批数'
+
+
+class RepeatedMeta(tuple):
+    """需要分批循环执行的 (判断SQL, 语句)，渲染为 Groovy 循环
+
+    remainder 为循环结束后在同一判断下执行一次的 AnnotatedMeta，处理超出批数仍剩余的行。
+    """
+
+    def __new__(cls, check_sql, statement, times, sleep=0, remainder=None):
+        meta = super().__new__(cls, (check_sql, statement))
+        meta.times = times
+        meta.sleep = sleep
+        meta.remainder = remainder
+        return meta
+
+
+class AnnotatedMeta(tuple):
+    """带说明的 (判断SQL, 语句)，说明渲染为语句前的一行 Groovy 注释"""
+
+    def __new__(cls, check_sql, statement, comment):
+        meta = super().__new__(cls, (check_sql, statement))
+        meta.comment = comment
+        return meta
+
+
+def _top_level_keywords(text):
+    """返回语句顶层出现的关键字及位置 [(关键字, 起始, 结束)]"""
+    keywords = []
+    depth = 0
+    for m in _KEYWORD_TOKEN_RE.finditer(text):
+        token = m.group()
+        if token == '(':
+            depth += 1
+        elif token == ')':
+            depth -= 1
+        elif depth == 0 and token[0] not in '\'"`':
+            keywords.append((' '.join(token.lower().split()), m.start(), m.end()))
+    return keywords
+
+
+def _split_dml(statement):
+    """拆出 (语句头, 表名, SET 子句, WHERE 条件)；不适合分批时返回 None"""
+    m = _DELETE_RE.match(statement)
+    is_update = False
+    if not m:
+        m = _UPDATE_RE.match(statement)
+        is_update = True
+    if not m:
+        return None
+
+    rest = statement[m.end():]
+    keywords = _top_level_keywords(rest)
+    if any(keyword != 'where' for keyword, _, _ in keywords):
+        return None
+    where = [k for k in keywords if k[0] == 'where']
+    if len(where) > 1:
+        return None
+    if where:
+        _, start, end = where[0]
+        body, condition = rest[:start].strip(), rest[end:].strip()
+    else:
+        body, condition = rest.strip(), ''
+    if is_update:
+        if not body:
+            return None
+    elif body:
+        # DELETE 表名后只允许 WHERE
+        return None
+    return m.group(1), m.group(2), body, condition
+
+
+def _literal(text):
+    """解析常量，返回 (类型, 原文, 比较用的值)；无法可靠比较的常量返回 None
+
+    字符串的比较结果取决于排序规则，只接受不含转义的 ASCII 字符串，比较用的值忽略大小写和尾部空格。
+    """
+    if text.lower() == 'null':
+        return 'null', None, None
+    if text[0] != "'":
+        return 'int', int(text), int(text)
+    value = text[1:-1].replace("''", "'")
+    if '\\' in value or not value.isascii():
+        return None
+    return 'str', value, value.lower().rstrip(' ')
+
+
+def _different(a, b):
+    """两个非 NULL 常量在任何排序规则下都不相等"""
+    return a[0] == b[0] and a[2] != b[2]
+
+
+def _same(a, b):
+    """两个非 NULL 常量在任何排序规则下都相等"""
+    return a[0] == b[0] and a[1] == b[1]
+
+
+def _excludes(condition, values):
+    """values 为 {字段: 常量}，判断字段取这些值后 condition 一定不成立"""
+    m = _COMPARISON_RE.fullmatch(condition)
+    if m:
+        value, literal = values.get(m.group(1).lower()), _literal(m.group(3))
+        if value is None or literal is None:
+            return False
+        op = m.group(2)
+        if op == '<=>':
+            if value[0] == 'null' or literal[0] == 'null':
+                return value[0] != literal[0]
+            return _different(value, literal)
+        if value[0] == 'null' or literal[0] == 'null':
+            return True  # 与 NULL 比较的结果为 NULL，不满足条件
+        if op == '=':
+            return _different(value, literal)
+        if op in ('!=', '<>'):
+            return _same(value, literal)
+        if value[0] != 'int' or literal[0] != 'int':
+            return False
+        a, b = value[2], literal[2]
+        return not {'<': a < b, '<=': a <= b, '>': a > b, '>=': a >= b}[op]
+
+    m = _IN_RE.fullmatch(condition)
+    if m:
+        value = values.get(m.group(1).lower())
+        literals = [_literal(item) if re.fullmatch(_LITERAL, item, re.I | re.S) else None
+                    for item in split_top_level(m.group(3))]
+        if value is None or None in literals:
+            return False
+        if value[0] == 'null':
+            return True
+        if m.group(2):
+            return any(literal[0] == 'null' or _same(value, literal) for literal in literals)
+        return all(literal[0] == 'null' or _different(value, literal) for literal in literals)
+
+    m = _IS_NULL_RE.fullmatch(condition)
+    if m:
+        value = values.get(m.group(1).lower())
+        return value is not None and (value[0] == 'null') == bool(m.group(2))
+    return False
+
+
+def _conjuncts(condition):
+    """按顶层 AND 拆分条件；顶层有 OR/XOR/BETWEEN 等时返回 None"""
+    parts = []
+    depth = 0
+    start = 0
+    for m in _CONDITION_TOKEN_RE.finditer(condition):
+        token = m.group().lower()
+        if token == '(':
+            depth += 1
+        elif token == ')':
+            depth -= 1
+        elif depth or token[0] in '\'"`':
+            continue
+        elif token == 'and':
+            parts.append(condition[start:m.start()].strip())
+            start = m.end()
+        else:
+            return None
+    parts.append(condition[start:].strip())
+    return parts
+
+
+def _update_shrinks(body, condition):
+    """UPDATE 执行后被更新的行是否一定不再满足 WHERE 条件
+
+    要求每个 SET 都是 字段 = 常量，且 WHERE 中某个顶层 AND 条件与其中一个常量矛盾；
+    否则每批 LIMIT 之后剩下的行未必减少（如 SET cnt = cnt + 1 WHERE cnt < 10）。
+    """
+    values = {}
+    for assignment in split_top_level(body):
+        m = _ASSIGNMENT_RE.fullmatch(assignment)
+        literal = _literal(m.group(2)) if m else None
+        if literal is None:
+            return False
+        values[m.group(1).lower()] = literal
+    conjuncts = _conjuncts(condition) if condition else None
+    return bool(conjuncts) and any(_excludes(part, values) for part in conjuncts)
+
+
+def chunk_dml(sql_metas, batch_size, sleep=0, max_batches=DEFAULT_DML_MAX_BATCHES, stats=None, remainder=False):
+    """把单表 DELETE/UPDATE 改写为带 LIMIT 的分批语句
+
+    每批执行前判断是否仍有满足条件的行，最多执行 max_batches 批，
+    sleep 大于 0 时每批之后 DO SLEEP(sleep) 以减轻主从延迟；
+    之后仍有剩余的行时默认执行一条报错的语句使脚本失败；remainder 为真时改为执行一次
+    不带 LIMIT 的原语句（会长时间持有锁，须确认剩余行数不多时使用）。
+    UPDATE 只有在每个 SET 都是常量、且 WHERE 条件能证明更新后的行不再满足条件时才分批，
+    带 LIMIT/ORDER BY、多表关联或已有判断的语句保持原样。
+    """
+    chunked = 0
+    for meta in sql_metas:
+        check_sql, statement = meta
+        parts = None if check_sql else _split_dml(statement)
+        if parts:
+            head, table, body, condition = parts
+            if body and not _update_shrinks(body, condition):
+                parts = None
+
+        if not parts:
+            yield meta
+            continue
+
+        where = f' WHERE {condition}' if condition else ''
+        set_clause = f' {body}' if body else ''
+        guard = f"SELECT EXISTS(SELECT 1 FROM {table}{where})"
+        chunked += 1
+        if remainder:
+            rest = AnnotatedMeta(guard, statement, '仍有剩余的行时不分批执行一次')
+        else:
+            message = REMAINING_ROWS_MESSAGE.format(times=max_batches)
+            rest = AnnotatedMeta(guard, REMAINING_ROWS_ERROR_SQL.format(message=message), '仍有剩余的行时报错')
+        yield RepeatedMeta(guard, f"{head}{set_clause}{where} LIMIT {batch_size}", max_batches, sleep, rest)
+
+    if stats is not None:
+        stats['dml_statements'] = chunked
+
+
+# 可以改为读取表级缓存的判断：规则名 -> (缓存判断模板, 判断的对象)
+_CACHED_GUARDS = {
+    'add_column': (CACHED_COLUMN_NOT_EXISTS, 'column'),
+    'modify_column': (CACHED_COLUMN_EXISTS, 'column'),
+    'drop_column': (CACHED_COLUMN_EXISTS, 'column'),
+    'add_index': (CACHED_INDEX_NOT_EXISTS, 'index'),
+    'create_index': (CACHED_INDEX_NOT_EXISTS, 'index'),
+    'drop_index': (CACHED_INDEX_EXISTS, 'index'),
+    'drop_index_on': (CACHED_INDEX_EXISTS, 'index'),
+}
+_DDL_RE = re.compile(r'\s*(?:alter|create|drop|rename|truncate)\b', re.I)
+
+
+def _has_top_level_comma(statement):
+    """语句顶层（不在字符串、括号内）是否有逗号，即是否包含多个子句"""
+    depth = 0
+    for m in _ROW_TOKEN_RE.finditer(statement):
+        token = m.group()
+        if token == '(':
+            depth += 1
+        elif token == ')':
+            depth -= 1
+        elif token == ',' and depth == 0:
+            return True
+    return False
+
+
+def split_top_level(text):
+    """按顶层逗号切分（忽略字符串、括号内的逗号），返回去除首尾空白的各段"""
+    parts = []
+    depth = 0
+    start = 0
+    for m in _ROW_TOKEN_RE.finditer(text):
+        token = m.group()
+        if token == '(':
+            depth += 1
+        elif token == ')':
+            depth -= 1
+        elif token == ',' and depth == 0:
+            parts.append(text[start:m.start()].strip())
+            start = m.end()
+    parts.append(text[start:].strip())
+    return parts
+
+
+# consolidate_guards 产出的预查询及读取其结果的判断，按变量名对应
+_PREFETCH_VAR_RE = re.compile(r'\bINTO @(sqlhelp_t\d+)_columns\b')
+_CACHED_VAR_RE = re.compile(r'@(sqlhelp_t\d+)_(?:columns|indexes)\b')
+
+
+def split_shards(sql_metas, size):
+    """按每个文件最多 size 条切分，保持原有顺序，逐个产出分片（列表）
+
+    sql_metas 可以是迭代器，同一时间只保留当前分片。没有语句时产出一个空分片。
+    各文件在各自的连接中执行，会话变量不能跨文件使用：分片中读取表级缓存的判断
+    所依赖的预查询若在之前的分片中，则在该分片开头重新执行会话设置和这些预查询（计入 size）。
+    """
+    current = []
+    available = set()  # 当前分片中已执行预查询的变量
+    has_setup = False
+    setup = None
+    prefetches = {}  # 变量 -> 预查询
+
+    def header_for(check_sql, prefetch):
+        """语句之前需要补执行的 (变量, 语句)；预查询本身也需要会话设置"""
+        needed = [var for var in dict.fromkeys(_CACHED_VAR_RE.findall(check_sql))
+                  if var not in available and var in prefetches]
+        need_setup = (needed or prefetch) and setup is not None and not has_setup
+        return needed, ([setup] if need_setup else []) + [prefetches[var] for var in needed]
+
+    for meta in sql_metas:
+        check_sql, statement = meta
+        # 预查询和会话设置都是改写时生成的字符串，其余语句可能是未解码的 StatementSpan
+        prefetch = None if check_sql or not isinstance(statement, str) else _PREFETCH_VAR_RE.search(statement)
+        needed, header = header_for(check_sql, prefetch)
+        if current and len(current) + len(header) >= size:
+            yield current
+            current, available, has_setup = [], set(), False
+            needed, header = header_for(check_sql, prefetch)
+        current.extend(header)
+        available.update(needed)
+        has_setup = has_setup or bool(header)
+        current.append(meta)
+        if not check_sql and statement == GROUP_CONCAT_SETUP_SQL:
+            setup = meta
+            has_setup = True
+        elif prefetch:
+            prefetches[prefetch.group(1)] = meta
+            available.add(prefetch.group(1))
+    yield current
+
+
+def consolidate_guards(sql_metas, rules=DEFAULT_RULES, stats=None):
+    """按 (库名, 表名) 合并判断：每张表只查询一次字段和索引，后续判断读取会话变量
+
+    预查询放在该表第一条需要判断的语句之前。同一名称在脚本中第二次被判断时
+    缓存已过期，保留原判断；无法确定影响范围的 DDL（多子句 ALTER、CHANGE COLUMN、
+    建表删表等）会使全部缓存失效，之后重新预查询。
+    """
+    tables = {}
+    setup = False
+    prefetches = cached = 0
+    for check_sql, statement in sql_metas:
+        match = rules.classify(statement)
+        cached_guard = _CACHED_GUARDS.get(match.kind)
+        if (not cached_guard or check_sql != match.check_sql or not match.table
+                or _has_top_level_comma(statement)):
+            if _DDL_RE.match(statement):
+                tables.clear()
+            yield check_sql, statement
+            continue
+
+        template, field = cached_guard
+        key = ((match.schema or '').lower(), match.table.lower())
+        if key not in tables:
+            if not setup:
+                yield "", GROUP_CONCAT_SETUP_SQL
+                setup = True
+            var = f'sqlhelp_t{prefetches}'
+            prefetches += 1
+            tables[key] = (var, set())
+            yield "", match.render(TABLE_PREFETCH_SQL, var=var)
+
+        var, touched = tables[key]
+        name = (field, getattr(match, field).lower())
+        if name in touched:
+            yield check_sql, statement
+        else:
+            cached += 1
+            yield match.render(template, var=var), statement
+        touched.add(name)
+
+    if stats is not None:
+        stats['guard_prefetches'] = prefetches
+        stats['guard_cached'] = cached
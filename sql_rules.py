@@ -0,0 +1,146 @@
+import re
+
+# 判断SQL模板：{schema} 已带引号（未指定库名时为 DATABASE()）
+COLUMN_NOT_EXISTS = "SELECT NOT EXISTS(SELECT * FROM `information_schema`.`COLUMNS` WHERE `TABLE_SCHEMA` = {schema} AND `TABLE_NAME` = '{table}' AND `COLUMN_NAME` IN ('{column}'))"
+COLUMN_EXISTS = "SELECT EXISTS(SELECT 1 FROM information_schema.COLUMNS WHERE table_schema = {schema} AND table_name = '{table}' AND column_name = '{column}')"
+INDEX_NOT_EXISTS = "SELECT NOT EXISTS (SELECT * FROM information_schema.statistics WHERE table_schema={schema} AND table_name = '{table}' AND index_name = '{index}')"
+INDEX_EXISTS = "SELECT EXISTS (SELECT * FROM information_schema.statistics WHERE table_schema={schema} AND table_name = '{table}' AND index_name = '{index}')"
+TABLE_NOT_EXISTS = "SELECT NOT EXISTS(SELECT 1 FROM information_schema.TABLES WHERE table_schema = {schema} AND table_name = '{table}')"
+
+# 规则模式中可用的占位符
+_IDENT = r'`?(?P<{group}>\w+)`?'
+_MACROS = {
+    'alter': r'alter\s+(?:online\s+|ignore\s+)?table\s+{table}\s+',
+    'table': r'(?:{schema}\s*\.\s*)?{table_name}',
+}
+# ADD/DROP 后面紧跟这些关键字时不是字段操作
+_NOT_COLUMN = r'(?!(?:index|key|unique|primary|constraint|fulltext|spatial|foreign|partition|check)\b)'
+
+FIELDS = ('schema', 'table', 'column', 'index')
+
+# "ALTER TABLE [库名.]表名 " 前缀，用于截取 ALTER 子句
+ALTER_PREFIX_RE = re.compile(
+    _MACROS['alter'].replace('{table}', r'(?:`?\w+`?\s*\.\s*)?`?\w+`?'), re.I)
+
+
+class Rule:
+    """语句分类规则
+
+    pattern 从语句开头匹配（忽略大小写），可使用占位符：
+    {alter} 匹配 "ALTER TABLE 表名 "，{table} 匹配 [库名.]表名，
+    {column}、{index} 匹配字段名和索引名。
+    guard 为判断SQL模板，为空表示该类语句不需要判断。
+    """
+
+    def __init__(self, name, pattern, guard=''):
+        self.name = name
+        self.pattern = pattern
+        self.guard = guard
+
+    def expand(self):
+        """展开占位符，分组名加上规则名前缀以便合并成一个正则"""
+        pattern = self.pattern
+        for macro, body in _MACROS.items():
+            pattern = pattern.replace('{%s}' % macro, body)
+        groups = {
+            'schema': _IDENT.format(group=f'{self.name}__schema'),
+            'table_name': _IDENT.format(group=f'{self.name}__table'),
+            'column': _IDENT.format(group=f'{self.name}__column'),
+            'index': _IDENT.format(group=f'{self.name}__index'),
+        }
+        for placeholder, body in groups.items():
+            pattern = pattern.replace('{%s}' % placeholder, body)
+        return f'(?P<{self.name}>{pattern})'
+
+
+class SqlMatch:
+    """一条语句的分类结果"""
+
+    __slots__ = ('kind', 'guard', 'schema', 'table', 'column', 'index')
+
+    def __init__(self, kind=None, guard='', schema=None, table=None, column=None, index=None):
+        self.kind = kind
+        self.guard = guard
+        self.schema = schema
+        self.table = table
+        self.column = column
+        self.index = index
+
+    def render(self, template, **extra):
+        """用语句的库名、表名、字段名、索引名填充 SQL 模板"""
+        schema = f"'{self.schema}'" if self.schema else 'DATABASE()'
+        return template.format(schema=schema, table=self.table, column=self.column, index=self.index, **extra)
+
+    @property
+    def check_sql(self):
+        """渲染判断SQL，无判断时返回空字符串"""
+        if not self.guard:
+            return ""
+        return self.render(self.guard)
+
+
+UNMATCHED = SqlMatch()
+
+
+class RuleSet:
+    """规则注册表：所有规则合并为一个带命名分组的正则，每条语句只匹配一次"""
+
+    def __init__(self, rules=()):
+        self._rules = {}
+        self._regex = None
+        for rule in rules:
+            self.register(rule)
+
+    def register(self, rule, before=None):
+        """注册规则；before 指定规则名时插入到该规则之前（规则按顺序尝试）"""
+        rules = [r for r in self._rules.values() if r.name != rule.name]
+        if before in self._rules:
+            position = next(i for i, r in enumerate(rules) if r.name == before)
+            rules.insert(position, rule)
+        else:
+            rules.append(rule)
+        self._rules = {r.name: r for r in rules}
+        self._regex = None
+
+    def unregister(self, name):
+        self._rules.pop(name, None)
+        self._regex = None
+
+    @property
+    def rules(self):
+        return list(self._rules.values())
+
+    def _compile(self):
+        self._regex = re.compile('|'.join(rule.expand() for rule in self._rules.values()), re.I | re.S)
+
+    def classify(self, statement):
+        """对单条语句分类并提取库名、表名、字段名、索引名"""
+        if self._regex is None:
+            self._compile()
+        m = self._regex.match(statement)
+        if not m:
+            return UNMATCHED
+        rule = self._rules[m.lastgroup]
+        groups = m.groupdict()
+        return SqlMatch(rule.name, rule.guard, *(groups.get(f'{rule.name}__{field}') for field in FIELDS))
+
+
+DEFAULT_RULES = RuleSet([
+    Rule('create_table', r'create\s+table\s+(?:if\s+not\s+exists\s+)?{table}', TABLE_NOT_EXISTS),
+    Rule('create_index', r'create\s+(?:unique\s+|fulltext\s+|spatial\s+)?index\s+{index}\s+on\s+{table}', INDEX_NOT_EXISTS),
+    Rule('drop_index_on', r'drop\s+index\s+{index}\s+on\s+{table}', INDEX_EXISTS),
+    Rule('add_index', r'{alter}add\s+(?:unique\s+|fulltext\s+|spatial\s+)?(?:index|key)\s+{index}', INDEX_NOT_EXISTS),
+    Rule('drop_index', r'{alter}drop\s+(?:index|key)\s+{index}', INDEX_EXISTS),
+    Rule('add_column', r'{alter}add\s+(?:column\s+)?' + _NOT_COLUMN + r'{column}', COLUMN_NOT_EXISTS),
+    Rule('modify_column', r'{alter}modify\s+(?:column\s+)?{column}', COLUMN_EXISTS),
+    Rule('change_column', r'{alter}change\s+(?:column\s+)?{column}', COLUMN_EXISTS),
+    Rule('drop_column', r'{alter}drop\s+(?:column\s+)?' + _NOT_COLUMN + r'{column}', COLUMN_EXISTS),
+    Rule('insert', r'(?:insert|replace)\s+(?:(?:low_priority|delayed|high_priority|ignore)\s+)*(?:into\s+)?{table}'),
+    Rule('update', r'update\s+(?:(?:low_priority|ignore)\s+)*{table}'),
+    Rule('delete', r'delete\s+(?:(?:low_priority|quick|ignore)\s+)*from\s+{table}'),
+])
+
+
+def register_rule(rule, before=None):
+    """向默认规则集注册新规则"""
+    DEFAULT_RULES.register(rule, before)
@@ -0,0 +1,82 @@
+import mmap
+from contextlib import contextmanager
+
+from sql_lexer import _DELIMITER_RE, _WHITESPACE, DEFAULT_DELIMITER, SqlLexer, iter_lines_from
+
+# 按 latin-1 解码时字节与字符一一对应，词法记号和空白都只按 ASCII 判断，
+# UTF-8 多字节字符不会被误认成记号，因此行内位置就是字节偏移
+
+
+class StatementSpan:
+    """语句在映射文件中的位置，只在需要文本时才解码
+
+    [start, end) 覆盖语句本身及其后的分隔符，delimiter 为当时生效的分隔符。
+    """
+
+    __slots__ = ('buffer', 'start', 'end', 'delimiter')
+
+    def __init__(self, buffer, start, end, delimiter):
+        self.buffer = buffer
+        self.start = start
+        self.end = end
+        self.delimiter = delimiter
+
+    def __len__(self):
+        return self.end - self.start
+
+    def __str__(self):
+        """重新切分该区间，得到与 iter_statements 相同的语句文本（已去除注释）"""
+        text = self.buffer[self.start:self.end].decode('utf-8')
+        # 常见情况：以分隔符结尾，且中间没有注释和其他分隔符，直接截取即可
+        if self.end < len(self.buffer) and text.endswith(self.delimiter):
+            body = text[:-len(self.delimiter)]
+            if not any(marker in body for marker in (self.delimiter, '--', '#', '/*')):
+                return body.strip(_WHITESPACE)
+        lexer = SqlLexer(self.delimiter)
+        statements = []
+        # 区间从行中间开始时，首行不能当作 DELIMITER 命令
+        line_start = self.start == 0 or self.buffer[self.start - 1:self.start] == b'\n'
+        for line in iter_lines_from(text):
+            statements.extend(lexer.feed(line, line_start))
+            if statements:
+                return statements[0]
+            line_start = True
+        statements.extend(lexer.close())
+        return statements[0] if statements else ''
+
+    def __repr__(self):
+        return f"StatementSpan({self.start}, {self.end})"
+
+
+def iter_spans(buffer, delimiter=DEFAULT_DELIMITER):
+    """在 bytes/mmap 上切分语句，逐条产出 StatementSpan，不保留语句文本"""
+    lexer = SqlLexer(delimiter)
+    start = 0
+    pos = 0
+    size = len(buffer)
+    while pos < size:
+        newline = buffer.find(b'\n', pos)
+        stop = size if newline < 0 else newline + 1
+        line = buffer[pos:stop].decode('latin-1')
+        span_delimiter = lexer.delimiter.encode('latin-1').decode('utf-8')
+        command = lexer.idle and _DELIMITER_RE.match(line)
+        for _, end in lexer.feed_with_ends(line):
+            yield StatementSpan(buffer, start, pos + end, span_delimiter)
+            start = pos + end
+        if command:
+            # DELIMITER 命令行不属于任何语句
+            start = stop
+        pos = stop
+    if lexer.close():
+        yield StatementSpan(buffer, start, size, lexer.delimiter.encode('latin-1').decode('utf-8'))
+
+
+@contextmanager
+def open_mapped(path):
+    """只读映射整个文件；空文件无法映射，返回空 bytes"""
+    with open(path, 'rb') as f:
+        if not f.seek(0, 2):
+            yield b''
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            yield buffer
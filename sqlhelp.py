@@ -1,8 +1,34 @@
+import argparse
+import copy
+import filecmp
+import hashlib
+import io
 import json
+import mmap
 import os
+import secrets
+import shutil
+import sys
+import tempfile
+from contextlib import contextmanager
 from datetime import datetime
 import re
-from templates.groovy_template import GROOVY_TEMPLATE
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+from templates.groovy_template import GROOVY_HEADER, GROOVY_FOOTER, GROOVY_LOOP_TEMPLATE
+from sql_lexer import iter_statements
+from sql_spans import iter_spans, open_mapped
+from sql_rules import DEFAULT_RULES
+from schema_snapshot import APPLIED, STATUS_LABELS, SchemaSnapshot, check_against_snapshot
+from ddl_advisor import DdlAdvisor, OSC_TOOLS, advise_ddl, load_table_stats
+from metrics import Metrics, NULL_METRICS, capture
+from sql_optimizer import (
+    coalesce_alters, batch_inserts, chunk_dml, consolidate_guards, split_shards, AnnotatedMeta, RepeatedMeta,
+    DEFAULT_INSERT_BATCH_BYTES, DEFAULT_DML_MAX_BATCHES
+)
 
 # 颜色常量
 GREEN = '\033[32m'
@@ -10,18 +36,159 @@ YELLOW = '\033[33m'
 RED = '\033[31m'
 RESET = '\033[0m'
 
+# JVM 单个方法的字节码不能超过 64KB，mainSql() 中每个 add(SqlMeta.build(...)) 调用约占 40 字节
+METHOD_BYTECODE_LIMIT = 65535
+BYTECODE_PER_STATEMENT = 40
+BYTECODE_RESERVED = 1024  # 方法其余部分及余量
+MAX_STATEMENTS_PER_FILE = (METHOD_BYTECODE_LIMIT - BYTECODE_RESERVED) // BYTECODE_PER_STATEMENT
+
+# 快照检查结果最多写入文件头的条数
+MAX_FINDING_NOTES = 50
+# 写入脚本文件的缓冲区大小
+WRITE_BUFFER_SIZE = 1 << 20
+# 多区划输出内容相同时的落盘方式，不支持时依次退回后一种
+LINK_MODES = ('hard', 'reflink', 'copy')
+FICLONE = 0x40049409  # Linux 的 reflink ioctl
+# 同步版本目录以文件读写为主，线程数可以多于 CPU 核数
+DEFAULT_SYNC_WORKERS = 8
+# 影响改写结果的库相关选项：指定任一选项时每个库单独改写和渲染
+DATABASE_OPTIONS = ('schema_snapshot', 'table_stats', 'online_ddl', 'order_ddl')
+
+class GenerationCancelled(Exception):
+    """生成过程被用户取消"""
+
+
+# 配置文件中由 Config 管理的字段，其余字段保存时原样保留
+CONFIG_FIELDS = ('root_dir', 'version_dir', 'responsible_person', 'databases', 'versions', 'regions')
+
+
+@contextmanager
+def file_lock(path):
+    """对 path 加进程间排他锁（建议锁，锁文件为 path + '.lock'）"""
+    with open(path + '.lock', 'a+') as f:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+# mkstemp 创建的文件权限为 0600，替换前按 umask 改回普通文件的权限
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """文件内容的 sha256（十六进制），分块读取，不把整个文件读入内存"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def atomic_write(path, text):
+    """先写临时文件再替换，其他进程不会读到写了一半的文件"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o666 & ~_UMASK)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+@contextmanager
+def replace_if_changed(path, unchanged=None, **open_args):
+    """写入临时文件，内容与现有文件不同时才替换，相同则保留原文件（修改时间不变）
+
+    unchanged 传入列表时，内容相同的路径会追加到其中。
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'w', **open_args) as f:
+            yield f
+        if os.path.isfile(path) and filecmp.cmp(tmp_path, path, shallow=False):
+            os.unlink(tmp_path)
+            if unchanged is not None:
+                unchanged.append(path)
+        else:
+            os.chmod(tmp_path, 0o666 & ~_UMASK)
+            os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def link_output(src, dst, mode='hard'):
+    """把 src 以硬链接、reflink 或复制的方式原子地放到 dst，返回实际使用的方式
+
+    不支持的方式（如跨文件系统的硬链接）依次退回后一种；dst 内容已相同时不做任何事，返回 None。
+    重新生成时文件总是被替换而不是原地修改，不会通过硬链接影响其他区划的文件。
+    """
+    if os.path.isfile(dst) and (os.path.samefile(src, dst) or filecmp.cmp(src, dst, shallow=False)):
+        return None
+    tmp_path = os.path.join(os.path.dirname(os.path.abspath(dst)), f'.tmp-{secrets.token_hex(8)}')
+    try:
+        for method in LINK_MODES[LINK_MODES.index(mode):]:
+            try:
+                if method == 'hard':
+                    os.link(src, tmp_path)
+                elif method == 'reflink':
+                    if not fcntl or not sys.platform.startswith('linux'):
+                        continue
+                    with open(src, 'rb') as source, open(tmp_path, 'wb') as target:
+                        fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+                else:
+                    shutil.copyfile(src, tmp_path)
+                    os.chmod(tmp_path, 0o666 & ~_UMASK)
+                break
+            except OSError:
+                if method == 'copy':
+                    raise
+                if os.path.lexists(tmp_path):
+                    os.unlink(tmp_path)
+        os.replace(tmp_path, dst)
+    except BaseException:
+        if os.path.lexists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return method
+
+
+def merge_list(base, mine, theirs):
+    """三方合并列表：保留本进程的顺序，加入其他进程新增的项，去掉其他进程删除的项"""
+    merged = [item for item in mine if item in theirs or item not in base]
+    merged += [item for item in theirs if item not in mine and item not in base]
+    return merged
+
+
 class Config:
+    # 进程内按配置文件路径共享的实例
+    _shared = {}
+
     def __init__(self, config_path='config.json'):
         self.config_path = config_path
+        self._listeners = []
+        self._stat = None
         try:
             with open(config_path, 'r', encoding='utf-8') as f:
                 config = json.load(f)
-                self.root_dir = config['root_dir']
-                self.version_dir = config['version_dir']
-                self.responsible_person = config['responsible_person']
-                self.databases = config['databases']
-                self.versions = config['versions']
-                self.regions = config['regions']
+                self._stat = self._file_stat()
+                self._apply(config)
         except FileNotFoundError:
             print(f"{RED}错误：找不到配置文件 config.json{RESET}")
             exit(1)
@@ -29,227 +196,317 @@ class Config:
             print(f"{RED}错误：config.json 格式不正确{RESET}")
             exit(1)
 
+    @classmethod
+    def shared(cls, config_path='config.json'):
+        """返回进程内共享的配置实例，同一文件只解析一次"""
+        key = os.path.abspath(config_path)
+        if key not in cls._shared:
+            cls._shared[key] = cls(config_path)
+        return cls._shared[key]
+
+    def add_listener(self, callback):
+        """注册配置变化回调，参数为发生变化的字段名列表"""
+        self._listeners.append(callback)
+
+    def _file_stat(self):
+        try:
+            st = os.stat(self.config_path)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _apply(self, config):
+        """用文件内容更新字段：本进程未修改的字段取文件中的值，修改过的列表做三方合并"""
+        base = getattr(self, '_base', None)
+        changed = []
+        for field in CONFIG_FIELDS:
+            theirs = config[field]
+            if base is None:
+                value = theirs
+            else:
+                mine = getattr(self, field)
+                if mine == base[field]:
+                    value = theirs
+                elif isinstance(mine, list) and isinstance(theirs, list):
+                    value = merge_list(base[field], mine, theirs)
+                else:
+                    value = mine
+                if value == mine:
+                    continue
+                changed.append(field)
+            setattr(self, field, list(value) if isinstance(value, list) else value)
+        # 文件内容的快照，保存时据此判断哪些字段被本进程修改过
+        self._base = {field: config[field] for field in CONFIG_FIELDS}
+        self._notify(changed)
+
+    def _notify(self, changed):
+        if changed:
+            for callback in list(self._listeners):
+                callback(changed)
+
+    def reload(self):
+        """配置文件的修改时间或大小变化时重新读取，返回是否重新读取"""
+        stat = self._file_stat()
+        if stat is None or stat == self._stat:
+            return False
+        try:
+            with open(self.config_path, 'r', encoding='utf-8') as f:
+                config = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            # 其他进程正在写入或文件被删除，保留当前配置
+            return False
+        self._stat = stat
+        self._apply(config)
+        return True
+
+    @property
+    def dirty(self):
+        return any(getattr(self, field) != self._base[field] for field in CONFIG_FIELDS)
+
     def move_to_front(self, list_name, value):
-        """将使用过的选项移到列表首位"""
-        if hasattr(self, list_name):
+        """将使用过的选项移到列表首位（只修改内存，由 save_config 统一保存）"""
+        if list_name in CONFIG_FIELDS:
             items = getattr(self, list_name)
             if value in items:
                 items.remove(value)
             items.insert(0, value)
-            setattr(self, list_name, items)
-            self.save_config()
+            self._notify([list_name])
 
     def save_config(self):
-        """保存配置到文件"""
-        config = {
-            'root_dir': self.root_dir,
-            'version_dir' : self.version_dir,
-            'responsible_person': self.responsible_person,
-            'databases': self.databases,
-            'versions': self.versions,
-            'regions': self.regions
-        }
-        with open(self.config_path, 'w', encoding='utf-8') as f:
-            json.dump(config, f, ensure_ascii=False, indent=2)
+        """保存配置到文件：加锁后与文件中其他进程的修改合并，再原子替换"""
+        dirty_fields = [field for field in CONFIG_FIELDS if getattr(self, field) != self._base[field]]
+        if not dirty_fields:
+            return
+        with file_lock(self.config_path):
+            try:
+                with open(self.config_path, 'r', encoding='utf-8') as f:
+                    disk = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                disk = {}
+
+            # 先把文件中的修改合并进来，再以合并结果写回
+            self._apply({field: disk.get(field, self._base[field]) for field in CONFIG_FIELDS})
+            config = dict(disk)
+            config.update((field, getattr(self, field)) for field in CONFIG_FIELDS)
+
+            if config != disk:
+                atomic_write(self.config_path, json.dumps(config, ensure_ascii=False, indent=2))
+            # config 中是本进程正在使用的列表，复制一份，否则之后的修改会同时改到快照
+            self._base = {field: copy.deepcopy(config[field]) for field in CONFIG_FIELDS}
+            self._stat = self._file_stat()
+        # 直接赋值修改的字段此前没有通知过
+        self._notify(dirty_fields)
 
 class SQLHelper:
-    def __init__(self):
-        self.config = Config()
-        
-    def get_user_input(self):
-        # 选择数据库
-        print("\n请选择数据库（输入数字选择，或直接输入新的数据库名）：")
-        for i, db in enumerate(self.config.databases, 1):
-            print(f"{GREEN}{i}. {db}{RESET}")
-        db_input = input().strip()
-        
-        try:
-            db_choice = int(db_input) - 1
-            if 0 <= db_choice < len(self.config.databases):
-                database = self.config.databases[db_choice]
-                self.config.move_to_front('databases', database)  # 移动到首位
-            else:
-                raise ValueError()
-        except ValueError:
-            database = db_input
-            if database and database not in self.config.databases:
-                print(f"{YELLOW}新数据库 '{database}' 将被添加到配置中{RESET}")
-                self.config.databases.insert(0, database)  # 新选项直接添加到首位
-                self.config.save_config()
-
-        # 选择版本
-        print("\n请选择版本号（输入数字选择，或直接输入新的版本号）：")
-        for i, version in enumerate(self.config.versions, 1):
-            print(f"{GREEN}{i}. {version}{RESET}")
-        version_input = input().strip()
+    def __init__(self, config_path='config.json'):
+        self.config = Config.shared(config_path)
+        self.rules = DEFAULT_RULES
+        self.max_statements_per_file = MAX_STATEMENTS_PER_FILE
+        self._loaded = {}  # (读取函数, 文件路径) -> (修改时间, 结果)
+        self.schema_findings = []  # 最近一次生成时的快照检查结果
+        self.osc_commands = []  # 最近一次生成时转由外部工具执行的 (判断SQL, 命令)
+        self.unchanged_files = []  # 最近一次生成时内容未变、未重写的文件
+        self.part_notes = []  # 最近一次生成时各文件头中的说明
+        self.linked_files = []  # 最近一次多区划生成时链接或复制的 (文件, 方式)
+        self.metrics = NULL_METRICS  # 启用 --profile 时替换为 Metrics
         
-        try:
-            version_choice = int(version_input) - 1
-            if 0 <= version_choice < len(self.config.versions):
-                version = self.config.versions[version_choice]
-                self.config.move_to_front('versions', version)
+    def choose_option(self, list_name, label, value=None, hint='', default_first=False, insert_front=False):
+        """从配置列表中选择一项或输入新值；value 已指定时不再提示，新值会加入配置"""
+        options = getattr(self.config, list_name)
+        if value is None:
+            print(f"\n请选择{label}（{hint}输入数字选择，或直接输入新的{label}）：")
+            for i, option in enumerate(options, 1):
+                print(f"{GREEN}{i}. {option}{RESET}")
+            value = input().strip()
+            if not value and default_first:
+                value = options[0]
+            elif value.isdigit() and 0 < int(value) <= len(options):
+                value = options[int(value) - 1]
+
+        if value in options:
+            self.config.move_to_front(list_name, value)  # 移动到首位
+        elif value:
+            print(f"{YELLOW}新{label} '{value}' 将被添加到配置中{RESET}")
+            if insert_front:
+                options.insert(0, value)  # 新选项直接添加到首位
             else:
-                raise ValueError()
-        except ValueError:
-            version = version_input
-            if version and version not in self.config.versions:
-                print(f"{YELLOW}新版本 '{version}' 将被添加到配置中{RESET}")
-                self.config.versions.append(version)
-                self.config.save_config()
-
-        # 选择执行区划
-        print("\n请选择执行区划（直接回车默认为'通用执行'，输入数字选择，或直接输入新的区划）：")
-        for i, region in enumerate(self.config.regions, 1):
-            print(f"{GREEN}{i}. {region}{RESET}")
-        region_input = input().strip()
-        
-        if not region_input:
-            region = self.config.regions[0]
-            self.config.move_to_front('regions', region)
-        else:
-            try:
-                region_choice = int(region_input) - 1
-                if 0 <= region_choice < len(self.config.regions):
-                    region = self.config.regions[region_choice]
-                    self.config.move_to_front('regions', region)
-                else:
-                    raise ValueError()
-            except ValueError:
-                region = region_input
-                if region and region not in self.config.regions:
-                    print(f"{YELLOW}新区划 '{region}' 将被添加到配置中{RESET}")
-                    self.config.regions.append(region)
-                    self.config.save_config()
+                options.append(value)
+        return value
+
+    def get_user_input(self, database=None, version=None, region=None, requirement_id=None,
+                       description=None, sql=None, interactive=True):
+        """收集生成脚本所需的输入，已通过参数指定的字段不再提示
+
+        sql 可以是字符串或文件对象；interactive 为 False 时不读取终端，
+        未指定的区划取配置中的第一个，需求号和说明必须指定（否则抛出 ValueError）。
+        """
+        if not interactive:
+            region = region or self.config.regions[0]
+            if not requirement_id or not description:
+                raise ValueError('非交互模式下必须指定需求号和说明')
+
+        database = self.choose_option('databases', '数据库', database, insert_front=True)
+        version = self.choose_option('versions', '版本号', version)
+        region = self.choose_option('regions', '执行区划', region, "直接回车默认为'通用执行'，", default_first=True)
+
+        # 所有选择完成后统一保存一次配置
+        self.config.save_config()
 
         # 获取其他输入
-        requirement_id = input("\n请输入需求号：")
-        description = input("请输入说明：")
-        
-        print("请输入 SQL 语句（输入完成后请输入一个点号(.)并回车）：")
-        sql_statements = []
-        current_statement = []
-        
-        # SQL关键字列表
-        sql_keywords = ('ALTER', 'CREATE', 'DROP', 'INSERT', 'UPDATE', 'DELETE')
-        
-        while True:
-            line = input()
-            if line.strip() == '.':
-                # 处理最后一个语句
-                if current_statement:
-                    stmt = ' '.join(current_statement)
-                    if not stmt.strip().endswith(';'):
-                        stmt += ';'
-                    sql_statements.append(stmt)
-                break
-            
-            line = line.strip()
-            if not line:
-                continue
-            
-            # 检查是否以SQL关键字开头
-            is_new_statement = any(line.upper().startswith(keyword) for keyword in sql_keywords)
-            
-            # 如果是新语句且当前有未完成的语句，先保存当前语句
-            if is_new_statement and current_statement:
-                stmt = ' '.join(current_statement)
-                if not stmt.strip().endswith(';'):
-                    stmt += ';'
-                sql_statements.append(stmt)
-                current_statement = []
-            
-            # 处理当前行包含分号的情况
-            if ';' in line:
-                parts = line.split(';')
-                # 处理除最后一部分外的所有部分
-                for part in parts[:-1]:
-                    if part.strip():
-                        if current_statement:
-                            current_statement.append(part.strip())
-                            sql_statements.append(' '.join(current_statement))
-                            current_statement = []
-                        else:
-                            sql_statements.append(part.strip() + ';')
-                
-                # 处理最后一部分
-                last_part = parts[-1].strip()
-                if last_part:
-                    # 检查最后一部分是否是新语句
-                    if any(last_part.upper().startswith(keyword) for keyword in sql_keywords):
-                        if current_statement:
-                            stmt = ' '.join(current_statement)
-                            if not stmt.endswith(';'):
-                                stmt += ';'
-                            sql_statements.append(stmt)
-                        current_statement = [last_part]
-                    else:
-                        current_statement.append(last_part)
-            else:
-                # 没有分号的情况
-                current_statement.append(line)
-        
+        if requirement_id is None:
+            requirement_id = input("\n请输入需求号：")
+        if description is None:
+            description = input("请输入说明：")
+        if sql is None:
+            print("请输入 SQL 语句（输入完成后请输入一个点号(.)并回车）：")
+            sql = ''.join(self.read_sql_lines())
+
         return {
             'database': database,
             'version': version,
             'region': region,
             'requirement_id': requirement_id,
             'description': description,
-            'sql': '\n'.join(sql_statements)
+            'sql': sql
         }
 
+    def read_sql_lines(self):
+        """逐行读取用户输入的 SQL，直到单独一行的点号或输入结束"""
+        while True:
+            try:
+                line = input()
+            except EOFError:
+                break
+            if line.strip() == '.':
+                break
+            yield line + '\n'
+
     def analyze_sql(self, sql):
-        sql_metas = []
-        statements = [s.strip() for s in sql.split(';') if s.strip()]
-        
+        return list(self.iter_sql_metas(sql))
+
+    def iter_classified(self, sql):
+        """逐条产出 (分类结果, 语句)"""
+        for statement in iter_statements(sql):
+            yield self.rules.classify(statement), statement
+
+    def analyze_statement(self, statement):
+        """分析单条语句，返回 (判断SQL, 语句)；无匹配规则的语句不添加判断
+
+        statement 也可以是 StatementSpan，分类时临时解码，结果中保留区间本身。
+        """
+        return (self.rules.classify(str(statement)).check_sql, statement)
+
+    def iter_sql_metas(self, sql):
+        """逐条分析 SQL，产出 (判断SQL, 语句)
+
+        sql 可以是字符串、文件对象，或映射到内存的 bytes/mmap（此时语句为 StatementSpan，渲染时才解码）。
+        """
+        statements = iter_spans(sql) if isinstance(sql, (bytes, mmap.mmap)) else iter_statements(sql)
+        if self.metrics.enabled:
+            yield from self.metrics.timed_iter('analyze', self.iter_counted_metas(statements))
+            return
         for statement in statements:
-            if not statement:
-                continue
-                
-            statement_lower = statement.lower()
-            
-            # 分析SQL类型并生成相应的判断逻辑
-            if 'insert into' in statement_lower:
-                sql_metas.append(("", statement))
-            elif 'delete from' in statement_lower:
-                # DELETE 语句不需要检查条件
-                sql_metas.append(("", statement))
-            elif 'add column' in statement_lower:
-                # 新增字段的判断逻辑
-                table_schema = re.search(r'`?(\w+)`?\.`?(\w+)`?', statement)
-                column_name = re.search(r'add\s+column\s+`?(\w+)`?', statement, re.I)
-                if table_schema and column_name:
-                    schema, table = table_schema.groups()
-                    column = column_name.group(1)
-                    check_sql = f"SELECT NOT EXISTS(SELECT * FROM `information_schema`.`COLUMNS` WHERE `TABLE_SCHEMA` = '{schema}' AND `TABLE_NAME` = '{table}' AND `COLUMN_NAME` IN ('{column}'))"
-                    sql_metas.append((check_sql, statement))
-            
-            elif 'modify column' in statement_lower:
-                # 修改字段的判断逻辑
-                table_schema = re.search(r'`?(\w+)`?\.`?(\w+)`?', statement)
-                column_name = re.search(r'modify\s+column\s+`?(\w+)`?', statement, re.I)
-                if table_schema and column_name:
-                    schema, table = table_schema.groups()
-                    column = column_name.group(1)
-                    check_sql = f"SELECT EXISTS(SELECT 1 FROM information_schema.COLUMNS WHERE table_schema = '{schema}' AND table_name = '{table}' AND column_name = '{column}')"
-                    sql_metas.append((check_sql, statement))
-            
-            elif 'add index' in statement_lower or 'add key' in statement_lower:
-                # 新增索引的判断逻辑
-                table_schema = re.search(r'`?(\w+)`?\.`?(\w+)`?', statement)
-                index_name = re.search(r'add\s+(?:index|key)\s+`?(\w+)`?', statement, re.I)
-                if table_schema and index_name:
-                    schema, table = table_schema.groups()
-                    index = index_name.group(1)
-                    check_sql = f"SELECT NOT EXISTS (SELECT * FROM information_schema.statistics WHERE table_schema='{schema}' AND table_name = '{table}' AND index_name = '{index}')"
-                    sql_metas.append((check_sql, statement))
-            else:
-                # 对于其他类型的SQL，不添加判断逻辑
-                sql_metas.append(("", statement))
-                
-        return sql_metas
+            yield self.analyze_statement(statement)
+
+    def iter_counted_metas(self, statements):
+        """同 analyze_statement，同时按规则类型统计语句数（仅在启用统计时使用）"""
+        for statement in statements:
+            match = self.rules.classify(str(statement))
+            self.metrics.count(f"statements.{match.kind or 'unmatched'}")
+            yield (match.check_sql, statement)
+
+    def load_cached(self, loader, path):
+        """用 loader 读取文件，文件未修改时复用上次的结果"""
+        mtime = os.stat(path).st_mtime_ns
+        cached = self._loaded.get((loader, path))
+        if cached and cached[0] == mtime:
+            return cached[1]
+        result = loader(path)
+        self._loaded[(loader, path)] = (mtime, result)
+        return result
+
+    def optimize_sql_metas(self, sql_metas, user_input):
+        """按用户选项对分析结果做可选的改写，返回 (sql_metas 列表, 写入文件头的说明)"""
+        sql_metas, notes = self.iter_optimized(sql_metas, user_input)
+        return list(sql_metas), notes
+
+    def iter_optimized(self, sql_metas, user_input):
+        """同 optimize_sql_metas，但逐条产出改写结果，返回 (迭代器, 说明)
+
+        说明依赖各项改写的统计，在迭代器全部取出后才填入列表。
+        """
+        stats = {}
+        notes = []
+        findings = self.schema_findings = []
+        if user_input.get('schema_snapshot'):
+            snapshot = self.load_cached(SchemaSnapshot.load, user_input['schema_snapshot'])
+            sql_metas = check_against_snapshot(sql_metas, snapshot, user_input['database'], self.rules,
+                                               user_input.get('drop_applied'), findings, stats)
+        # 改写需要语句文本，StatementSpan 在这里解码
+        if any(user_input.get(key) for key in ('table_guards', 'merge_alters', 'insert_batch_rows', 'dml_batch_size',
+                                               'table_stats', 'online_ddl', 'order_ddl')):
+            sql_metas = ((check_sql, str(statement)) for check_sql, statement in sql_metas)
+        if user_input.get('table_guards'):
+            sql_metas = consolidate_guards(sql_metas, self.rules, stats)
+        if user_input.get('merge_alters'):
+            sql_metas = coalesce_alters(sql_metas, self.rules, stats)
+        batch_rows = user_input.get('insert_batch_rows') or 0
+        batch_bytes = user_input.get('insert_batch_bytes') or DEFAULT_INSERT_BATCH_BYTES
+        if batch_rows > 1:
+            sql_metas = batch_inserts(sql_metas, batch_rows, batch_bytes, stats)
+        dml_batch_size = user_input.get('dml_batch_size') or 0
+        dml_sleep = user_input.get('dml_sleep') or 0
+        dml_max_batches = user_input.get('dml_max_batches') or DEFAULT_DML_MAX_BATCHES
+        if dml_batch_size > 0:
+            sql_metas = chunk_dml(sql_metas, dml_batch_size, dml_sleep, dml_max_batches, stats,
+                                  user_input.get('dml_remainder'))
+        osc_commands = self.osc_commands = []
+        osc_tool = user_input.get('osc_tool') or OSC_TOOLS[0]
+        if user_input.get('table_stats') or user_input.get('online_ddl') or user_input.get('order_ddl'):
+            table_stats = self.load_cached(load_table_stats, user_input['table_stats']) if user_input.get('table_stats') else {}
+            advisor = DdlAdvisor(table_stats, user_input['database'], self.rules)
+            sql_metas = advise_ddl(sql_metas, advisor, user_input.get('online_ddl'), user_input.get('osc_threshold') or 0,
+                                   osc_tool, osc_commands, user_input.get('order_ddl'), stats)
+
+        def drain():
+            # 全部取出后统计才完整，此时填写说明
+            yield from sql_metas
+            if 'snapshot_dropped' in stats:
+                notes.append(f"快照检查：已执行 {stats['snapshot_applied']} 条（删除 {stats['snapshot_dropped']} 条），"
+                             f"表不存在 {stats['snapshot_missing_table']} 条，字段不存在 {stats['snapshot_missing_column']} 条")
+                for number, status, statement in findings[:MAX_FINDING_NOTES]:
+                    notes.append(f"  第 {number} 条{STATUS_LABELS[status]}：{self.summarize(statement)}")
+                if len(findings) > MAX_FINDING_NOTES:
+                    notes.append(f"  …… 其余 {len(findings) - MAX_FINDING_NOTES} 条略")
+            if 'guard_prefetches' in stats:
+                notes.append(f"表级判断：{stats['guard_prefetches']} 次预查询，{stats['guard_cached']} 条判断读取缓存")
+            if 'alter_statements' in stats:
+                notes.append(f"ALTER 合并：{stats['alter_statements']} 条合并为 {stats['alter_batches']} 条；"
+                             f"部分字段或索引已存在、合并语句被跳过时，由其后保留的原语句逐条补执行")
+            if 'insert_statements' in stats:
+                notes.append(f"INSERT 合并：每批最多 {batch_rows} 行/{batch_bytes} 字节，"
+                             f"{stats['insert_statements']} 条合并为 {stats['insert_batches']} 条")
+            if stats.get('dml_statements'):
+                notes.append(f"DELETE/UPDATE 分批：{stats['dml_statements']} 条，每批 {dml_batch_size} 行，"
+                             f"最多 {dml_max_batches} 批，批间休眠 {dml_sleep} 秒，超出批数仍有剩余的行时"
+                             + ("不分批执行一次" if user_input.get('dml_remainder') else "报错，须确认后手动处理"))
+            if 'ddl_annotated' in stats:
+                notes.append(f"DDL 评估：{stats['ddl_annotated']} 条，改写为 Online DDL {stats['ddl_online']} 条，"
+                             f"调整顺序 {stats['ddl_reordered']} 条")
+            if osc_commands:
+                notes.append(f"大表变更：{len(osc_commands)} 条 ALTER 已移出脚本，须在执行本脚本前"
+                             f"按同名 _osc.sh 文件用 {osc_tool} 执行")
+
+        return drain(), notes
 
-    def generate_file_name(self, user_input):
-        date_str = datetime.now().strftime('%Y%m%d')
+    def summarize(self, statement, width=80):
+        """语句压缩为一行，过长时截断；会写入文件头注释，需避免出现注释结束符"""
+        text = ' '.join(statement.split()).replace('*/', '* /')
+        return text if len(text) <= width else text[:width - 1] + '…'
+
+    def generate_file_name(self, user_input, part=1):
+        # 重新生成已有脚本时沿用原来的日期
+        date_str = user_input.get('date') or datetime.now().strftime('%Y%m%d')
         # 数据库名使用大写
         db_name = user_input['database'].upper()
         requirement_id = user_input['requirement_id']
@@ -257,25 +514,65 @@ class SQLHelper:
         # 如果 requirement_id 包含 @，则不加 #
         requirement_part = requirement_id if '@' in requirement_id else f"#{requirement_id}"
         
-        return f"DB_{db_name}_{requirement_part}_01_{date_str}_{user_input['description']}"
+        return f"DB_{db_name}_{requirement_part}_{part:02d}_{date_str}_{user_input['description']}"
+
+    def split_sql_metas(self, sql_metas):
+        """按 mainSql() 的字节码估算把语句切分为多个文件，保持原有顺序"""
+        return split_shards(sql_metas, self.max_statements_per_file)
+
+    def render_sql_meta(self, check_sql, sql, indent=' ' * 16):
+        # 判断SQL放在 Groovy 双引号字符串中，需要转义
+        check_sql = check_sql.replace('\\', '\\\\').replace('"', '\\"').replace('$', '\\$')
+        return f"{indent}add(SqlMeta.build(\"{check_sql}\", ''' {sql}; '''))"
 
-    def generate_groovy_content(self, user_input, sql_metas):
-        sql_statements = []
-        for check_sql, sql in sql_metas:
-            if check_sql:
-                sql_statements.append(f"                add(SqlMeta.build(\"{check_sql}\", ''' {sql}; '''))")
+    def render_statements(self, sql_metas):
+        """逐条产出渲染好的 SqlMeta 代码"""
+        for meta in sql_metas:
+            check_sql, sql = meta
+            if isinstance(meta, AnnotatedMeta):
+                yield f"                // {meta.comment}\n" + self.render_sql_meta(check_sql, sql)
+            elif isinstance(meta, RepeatedMeta):
+                statements = [self.render_sql_meta(check_sql, sql, ' ' * 20)]
+                if meta.sleep:
+                    statements.append(self.render_sql_meta(check_sql, f"DO SLEEP({meta.sleep})", ' ' * 20))
+                remainder = ''.join(self.render_statements([meta.remainder])) if meta.remainder else ''
+                yield GROOVY_LOOP_TEMPLATE.format(times=meta.times, statements='\n'.join(statements),
+                                                  remainder=remainder).rstrip('\n')
             else:
-                sql_statements.append(f"                add(SqlMeta.build(\"\", ''' {sql}; '''))")
+                yield self.render_sql_meta(check_sql, sql)
 
-        return GROOVY_TEMPLATE.format(
+    def render_header(self, user_input, notes=(), part=1):
+        """文件头：脚本中与库、文件名相关的部分都在这里"""
+        return GROOVY_HEADER.format(
             version=user_input['version'],
             database=user_input['database'].lower(),  # 数据库名使用小写
-            change_id=self.generate_file_name(user_input),  # 不包含.groovy后缀
+            change_id=self.generate_file_name(user_input, part),  # 不包含.groovy后缀
             responsible_person=self.config.responsible_person,
-            sql_statements='\n'.join(sql_statements)
+            notes=''.join(f" * {note}\n" for note in notes)
         )
 
-    def create_groovy_file(self, user_input):
+    def write_groovy_content(self, f, user_input, sql_metas, notes=(), part=1):
+        """把脚本逐条写入文件对象 f，不在内存中拼接整个脚本"""
+        f.write(self.render_header(user_input, notes, part))
+        self.write_groovy_body(f, sql_metas)
+
+    def write_groovy_body(self, f, sql_metas):
+        """写入文件头之后的部分：各条 SqlMeta 与文件尾"""
+        separator = ''
+        for statement in self.render_statements(sql_metas):
+            f.write(separator)
+            f.write(statement)
+            separator = '\n'
+        f.write(GROOVY_FOOTER)
+
+    def generate_groovy_content(self, user_input, sql_metas, notes=(), part=1):
+        """渲染为字符串，用于预览"""
+        buffer = io.StringIO()
+        self.write_groovy_content(buffer, user_input, sql_metas, notes, part)
+        return buffer.getvalue()
+
+    def get_output_dirs(self, user_input):
+        """返回 (生成目录, 版本目录)"""
         # 子文件夹
         note = user_input.get('database', '')
         # 确保 note 是字符串，并进行安全分割
@@ -299,23 +596,211 @@ class SQLHelper:
             user_input['region'],
             note
         )
+        return dir_path, version_dir
+
+    def track_progress(self, sql_metas, sql, progress, every=500):
+        """按已分析的字符数报告分析进度；sql 为流时总量未知，total 为 0"""
+        total = len(sql) if isinstance(sql, (str, bytes, mmap.mmap)) else 0
+        done = 0
+        for count, meta in enumerate(sql_metas, 1):
+            done += len(meta[1]) + 1
+            if count % every == 0:
+                progress('分析', min(done, total), total)
+            yield meta
+        progress('分析', total, total)
+
+    def write_groovy_files(self, user_input, progress=None):
+        """分析SQL并写入 groovy 文件，超出方法大小限制时拆分为多个文件，返回文件路径列表
+
+        progress(阶段, 已完成, 总数) 用于报告进度，回调中抛出 GenerationCancelled 可取消生成，
+        已写入的文件会被删除。内容与现有文件相同的不重写，记录在 unchanged_files 中。
+        """
+        # 分析SQL
+        sql_metas = self.iter_sql_metas(user_input['sql'])
+        if progress:
+            sql_metas = self.track_progress(sql_metas, user_input['sql'], progress)
+        return self.write_sql_metas(user_input, sql_metas, progress)
+
+    def write_sql_metas(self, user_input, sql_metas, progress=None):
+        """改写、拆分已分析的语句并写入 groovy 文件，返回文件路径列表
+
+        语句逐条改写、按分片写出，内存中最多保留两个分片。文件头中的说明在全部语句改写完后才确定：
+        只有一个文件时直接写入；拆分为多个文件时各分片的正文先写入临时文件，最后再加上文件头。
+        """
+        dir_path, _ = self.get_output_dirs(user_input)
+        metrics = self.metrics
+        sql_metas, notes = self.iter_optimized(sql_metas, user_input)
+        # 分析、改写和拆分在取出分片时进行；analyze 区间的耗时不计入 optimize
+        shards = metrics.timed_iter('optimize', self.split_sql_metas(sql_metas))
+        with metrics.span('makedirs'):
+            os.makedirs(dir_path, exist_ok=True)
+
+        file_paths = []
+        unchanged = self.unchanged_files = []
+        self.part_notes = []
+        bodies = []  # 拆分为多个文件时各分片正文的临时文件
+
+        def write_body(part_metas):
+            fd, body_path = tempfile.mkstemp(dir=dir_path, prefix='.tmp-')
+            bodies.append(body_path)
+            with metrics.span('render'), os.fdopen(fd, 'w', encoding='utf-8', buffering=WRITE_BUFFER_SIZE) as f:
+                self.write_groovy_body(metrics.writer(f), part_metas)
+
+        try:
+            first = next(shards)
+            second = next(shards, None)
+            if second is not None:
+                write_body(first)
+                write_body(second)
+                first = second = None
+                for part_metas in shards:
+                    write_body(part_metas)
+
+            total = len(bodies) or 1
+            for part in range(1, total + 1):
+                part_notes = notes
+                if total > 1:
+                    part_notes = notes + [f"脚本拆分：第 {part}/{total} 个，须按序号顺序执行"]
+                self.part_notes.append(part_notes)
+
+                # 生成文件名和内容
+                file_name = self.generate_file_name(user_input, part) + '.groovy'  # 这里添加.groovy后缀
+                file_path = os.path.join(dir_path, file_name)
+
+                # file 区间为打开、比较、替换文件的耗时
+                with metrics.span('file'):
+                    with replace_if_changed(file_path, unchanged, encoding='utf-8', buffering=WRITE_BUFFER_SIZE) as f:
+                        if bodies:
+                            f.write(self.render_header(user_input, part_notes, part))
+                            f.flush()
+                            with open(bodies[part - 1], 'rb') as body:
+                                shutil.copyfileobj(body, f.buffer, WRITE_BUFFER_SIZE)
+                        else:
+                            with metrics.span('render'):
+                                self.write_groovy_content(metrics.writer(f), user_input, first, part_notes, part)
+                file_paths.append(file_path)
+                self.count_output(file_path)
+                if progress:
+                    progress('写入', part, total)
+
+            if self.osc_commands:
+                file_path = os.path.join(dir_path, self.generate_file_name(user_input) + '_osc.sh')
+                with metrics.span('file'):
+                    self.write_osc_file(file_path, self.osc_commands)
+                file_paths.append(file_path)
+                self.count_output(file_path)
+        except GenerationCancelled:
+            for file_path in file_paths:
+                if file_path not in unchanged:
+                    os.remove(file_path)
+            raise
+        finally:
+            for body_path in bodies:
+                if os.path.exists(body_path):
+                    os.unlink(body_path)
+        return file_paths
+
+    def rebase_files(self, src_input, src_paths, part_notes, user_input):
+        """把按 src_input 生成的脚本换上 user_input 的文件头另存，正文直接复制而不重新渲染"""
+        dir_path, _ = self.get_output_dirs(user_input)
         os.makedirs(dir_path, exist_ok=True)
+        file_paths = []
+        unchanged = self.unchanged_files = []
+        for part, (src_path, notes) in enumerate(zip(src_paths, part_notes), 1):
+            # 文本模式写入时换行符按平台转换，正文的起始位置要按转换后的字节数计算
+            header = self.render_header(src_input, notes, part)
+            offset = len(header.replace('\n', os.linesep).encode('utf-8'))
+            file_path = os.path.join(dir_path, self.generate_file_name(user_input, part) + '.groovy')
+            with open(src_path, 'rb') as source, \
+                    replace_if_changed(file_path, unchanged, encoding='utf-8', buffering=WRITE_BUFFER_SIZE) as f:
+                f.write(self.render_header(user_input, notes, part))
+                f.flush()
+                source.seek(offset)
+                shutil.copyfileobj(source, f.buffer, WRITE_BUFFER_SIZE)
+            file_paths.append(file_path)
+        return file_paths
 
-        # 生成文件名和内容
-        file_name = self.generate_file_name(user_input) + '.groovy'  # 这里添加.groovy后缀
-        file_path = os.path.join(dir_path, file_name)
-        
-        # 分析SQL并生成内容
-        sql_metas = self.analyze_sql(user_input['sql'])
-        content = self.generate_groovy_content(user_input, sql_metas)
+    def write_fanout(self, user_input, databases, regions, link_mode='hard'):
+        """一次分析，为多个库 × 多个区划生成脚本，返回 [(库, 区划, 文件路径列表)]
+
+        改写结果与库无关时只渲染第一个库，其他库只重新生成文件头；
+        区划不影响脚本内容，第一个区划之外的文件按 link_mode 链接或复制。
+        """
+        sql_metas = list(self.iter_sql_metas(user_input['sql']))
+        per_database = any(user_input.get(key) for key in DATABASE_OPTIONS)
+        results = []
+        unchanged = []
+        self.linked_files = []
+        first = None
+        for database in databases:
+            db_input = dict(user_input, database=database, region=regions[0])
+            if first is None or per_database:
+                file_paths = self.write_sql_metas(db_input, sql_metas)
+                first = (db_input, file_paths, self.part_notes)
+            else:
+                file_paths = self.rebase_files(*first, db_input)
+            unchanged += self.unchanged_files
+            results.append((database, regions[0], file_paths))
+
+            for region in regions[1:]:
+                dir_path, _ = self.get_output_dirs(dict(db_input, region=region))
+                os.makedirs(dir_path, exist_ok=True)
+                region_paths = []
+                for src_path in file_paths:
+                    file_path = os.path.join(dir_path, os.path.basename(src_path))
+                    method = link_output(src_path, file_path, link_mode)
+                    if method:
+                        self.linked_files.append((file_path, method))
+                    else:
+                        unchanged.append(file_path)
+                    region_paths.append(file_path)
+                results.append((database, region, region_paths))
+        self.unchanged_files = unchanged
+        return results
+
+    def create_fanout_files(self, user_input, databases, regions, link_mode='hard'):
+        """多库、多区划生成并打印结果，返回全部文件路径"""
+        results = self.write_fanout(user_input, databases, regions, link_mode)
+        file_paths = []
+        for database, region, paths in results:
+            print(f"\n{GREEN}{database} / {region}{RESET}")
+            for file_path in paths:
+                print(f"  {file_path}")
+            file_paths += paths
+        methods = [method for _, method in self.linked_files]
+        print(f"\n共 {len(file_paths)} 个文件：硬链接 {methods.count('hard')}，reflink {methods.count('reflink')}，"
+              f"复制 {methods.count('copy')}，内容未变 {len(self.unchanged_files)}")
+        return file_paths
+
+    def count_output(self, file_path):
+        """统计写入和内容未变的文件数、字节数"""
+        if self.metrics.enabled:
+            kind = 'unchanged' if file_path in self.unchanged_files else 'written'
+            self.metrics.count(f'files_{kind}')
+            self.metrics.count(f'bytes_{kind}', os.path.getsize(file_path))
 
-        # 写入文件
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(content)
+    def write_osc_file(self, file_path, osc_commands):
+        """写入大表变更命令文件，每条命令前注明对应的判断SQL"""
+        with replace_if_changed(file_path, self.unchanged_files, encoding='utf-8', newline='\n') as f:
+            f.write("#!/bin/sh\n# 连接信息取自环境变量 MYSQL_HOST、MYSQL_PORT、MYSQL_USER、MYSQL_PASSWORD\n"
+                    "# 执行前先确认判断SQL的结果为 1（结果为 0 表示已执行过，跳过该命令）\nset -e\n")
+            for check_sql, command in osc_commands:
+                if check_sql:
+                    f.write(f"\n# 判断：{' '.join(check_sql.split())}")
+                f.write(f"\n{command}\n")
 
-        print(f"\n文件已生成：{file_path}")
+    def create_groovy_file(self, user_input):
+        file_paths = self.write_groovy_files(user_input)
+        dir_path, version_dir = self.get_output_dirs(user_input)
+
+        for number, status, statement in self.schema_findings:
+            color = YELLOW if status == APPLIED else RED
+            print(f"{color}[快照] 第 {number} 条{STATUS_LABELS[status]}：{self.summarize(statement)}{RESET}")
+        for file_path in file_paths:
+            print(f"\n文件已生成：{file_path}")
         print(f"\n文件路径：{dir_path}")
         print(f"\n版本路径：{version_dir}")
+        return file_paths
         
     def get_parent_folder(self, version):
         match = re.match(r'^(V\d+)\.(\d+)', version)  # 提取主版本号 (Vx) 和次版本号 (y)
@@ -325,10 +810,216 @@ class SQLHelper:
         return "V6.0"  # 默认情况
 
 
+# 命令行中直接写入 user_input 的生成选项
+OPTION_ARGS = ('schema_snapshot', 'drop_applied', 'table_guards', 'merge_alters', 'insert_batch_rows',
+               'insert_batch_bytes', 'dml_batch_size', 'dml_sleep', 'dml_max_batches', 'dml_remainder',
+               'table_stats', 'online_ddl', 'osc_threshold', 'osc_tool', 'order_ddl')
+
+
+def parse_size(text):
+    """解析带单位的大小（如 10G、512M），返回字节数"""
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+    text = text.strip().upper().rstrip('B')
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+@contextmanager
+def open_sql_source(path):
+    """打开 SQL 输入：'-' 为标准输入（按流读取），None 表示交互输入，文件映射到内存"""
+    if path is None:
+        yield None
+    elif path == '-':
+        with open(sys.stdin.fileno(), 'r', encoding='utf-8', closefd=False) as f:
+            yield f
+    else:
+        with open_mapped(path) as buffer:
+            yield buffer
+
+
+def split_list(text):
+    """逗号分隔的列表，去掉空项和重复项"""
+    items = []
+    for item in (text or '').split(','):
+        item = item.strip()
+        if item and item not in items:
+            items.append(item)
+    return items
+
+
+def profile_enabled(options):
+    """options 中 profile、profile_cpu、profile_memory 任一启用时需要统计"""
+    return any(options.get(key) for key in ('profile', 'profile_cpu', 'profile_memory'))
+
+
 def main():
-    helper = SQLHelper()
-    user_input = helper.get_user_input()
-    helper.create_groovy_file(user_input)
+    parser = argparse.ArgumentParser(prog='sqlhelp', description='生成 Groovy 数据库脚本', allow_abbrev=False)
+    parser.add_argument('--config', default='config.json', help='配置文件路径')
+    parser.add_argument('--database', help='数据库名，未指定时交互选择')
+    parser.add_argument('--version', help='版本号，未指定时交互选择')
+    parser.add_argument('--region', help='执行区划，未指定时交互选择')
+    parser.add_argument('--req', help='需求号，未指定时交互输入')
+    parser.add_argument('--desc', help='脚本说明，未指定时交互输入')
+    parser.add_argument('--databases', metavar='DB1,DB2',
+                        help='一次为多个库生成（逗号分隔，第一个为主库），语句只分析一次，不能与 --database 同时使用')
+    parser.add_argument('--regions', metavar='R1,R2',
+                        help='一次为多个区划生成（逗号分隔），内容相同的文件按 --link-mode 链接，不能与 --region 同时使用')
+    parser.add_argument('--link-mode', choices=LINK_MODES, default=LINK_MODES[0],
+                        help='多区划输出的落盘方式，默认硬链接（注意：直接编辑硬链接的文件会同时改动各区划）')
+    parser.add_argument('--sql-file', metavar='PATH',
+                        help="SQL 文件路径，'-' 表示从标准输入读取（无需结束符），未指定时交互输入")
+    parser.add_argument('--schema-snapshot', metavar='PATH',
+                        help='表结构快照（mysqldump --no-data 输出或 information_schema 的 JSON 导出），'
+                             '生成时检查已执行的语句和不存在的表/字段')
+    parser.add_argument('--drop-applied', action='store_true', help='配合 --schema-snapshot，删除快照中已执行的语句')
+    parser.add_argument('--table-guards', action='store_true',
+                        help='每张表只查询一次 information_schema，判断改为读取缓存（需同一连接执行）')
+    parser.add_argument('--merge-alters', action='store_true',
+                        help='合并连续的同表 ADD COLUMN/ADD INDEX 语句，合并语句被跳过时由其后保留的原语句逐条补执行')
+    parser.add_argument('--insert-batch-rows', type=int, default=0, metavar='N',
+                        help='把连续的单行 INSERT 合并为每批最多 N 行的多行 INSERT，0 表示不合并')
+    parser.add_argument('--insert-batch-bytes', type=int, default=DEFAULT_INSERT_BATCH_BYTES, metavar='M',
+                        help='每条合并后的 INSERT 最多 M 字节')
+    parser.add_argument('--dml-batch-size', type=int, default=0, metavar='N',
+                        help='把单表 DELETE/UPDATE 改写为每批 N 行的分批执行，0 表示不改写')
+    parser.add_argument('--dml-sleep', type=float, default=0, metavar='SECONDS', help='分批执行时每批之后休眠的秒数')
+    parser.add_argument('--dml-max-batches', type=int, default=DEFAULT_DML_MAX_BATCHES, metavar='K',
+                        help='分批执行的最大批数，之后仍有剩余的行时报错使脚本失败')
+    parser.add_argument('--dml-remainder', action='store_true',
+                        help='分批执行达到最大批数后仍有剩余的行时，不分批执行一次原语句而不是报错（会长时间持有锁）')
+    parser.add_argument('--table-stats', metavar='PATH',
+                        help='表统计文件（information_schema.TABLES 导出的 JSON 或 CSV/TSV），用于估算 DDL 代价')
+    parser.add_argument('--online-ddl', action='store_true',
+                        help='MySQL 5.7 支持时为 DDL 追加 ALGORITHM=INPLACE, LOCK=NONE')
+    parser.add_argument('--osc-threshold', type=parse_size, default=0, metavar='SIZE',
+                        help='数据量不小于 SIZE（如 10G）的表的 ALTER 改为生成外部工具命令文件，0 表示不转换')
+    parser.add_argument('--osc-tool', choices=OSC_TOOLS, default=OSC_TOOLS[0], help='大表变更使用的工具')
+    parser.add_argument('--order-ddl', action='store_true',
+                        help='连续的 DDL 中先执行不阻塞读写、代价小的语句（同一张表保持原有顺序）')
+    subparsers = parser.add_subparsers(dest='command')
+
+    batch_parser = subparsers.add_parser('batch', help='按 JSONL 清单批量生成脚本')
+    batch_parser.add_argument('manifest', help='清单文件，每行一个 JSON 对象')
+    batch_parser.add_argument('-j', '--workers', type=int, default=None, help='并行进程数，默认为 CPU 核数')
+
+    rebuild_parser = subparsers.add_parser('rebuild', help='按清单增量重新生成：只处理输入有变化的脚本')
+    rebuild_parser.add_argument('manifest', help='清单文件，格式与 batch 相同')
+    rebuild_parser.add_argument('-j', '--workers', type=int, default=None, help='并行进程数，默认为 CPU 核数')
+    rebuild_parser.add_argument('--force', action='store_true', help='忽略输入记录，全部重新生成（内容相同的文件仍不重写）')
+
+    find_parser = subparsers.add_parser('find', help='在已生成的脚本中按需求号、库、表、字段查找')
+    find_parser.add_argument('--req', dest='find_requirement_id', help='需求号')
+    find_parser.add_argument('--database', dest='find_database', help='数据库')
+    find_parser.add_argument('--version', dest='find_version', help='版本号')
+    find_parser.add_argument('--region', dest='find_region', help='执行区划')
+    find_parser.add_argument('--table', help='涉及的表名')
+    find_parser.add_argument('--column', help='涉及的字段名')
+    find_parser.add_argument('--no-refresh', action='store_true', help='不扫描目录，直接查询现有索引')
+    watch_parser = subparsers.add_parser('watch', help='监视目录，新增或修改的 .sql 文件自动生成脚本')
+    watch_parser.add_argument('directory', help='监视的目录（含子目录）')
+    watch_parser.add_argument('-j', '--workers', type=int, default=None, help='并行进程数，默认为 CPU 核数与 4 中较小者')
+    watch_parser.add_argument('--debounce', type=float, default=0.3, metavar='SECONDS',
+                              help='文件停止变化多久后开始生成，默认 0.3 秒')
+    watch_parser.add_argument('--poll', action='store_true', help='不使用 inotify，定期扫描目录')
+    watch_parser.add_argument('--interval', type=float, default=0.5, metavar='SECONDS', help='轮询扫描的间隔，默认 0.5 秒')
+    watch_parser.add_argument('--scan-existing', action='store_true', help='启动时先为目录中已有的 .sql 文件生成脚本')
+    check_parser = subparsers.add_parser('check', help='检查已生成的脚本之间重复或冲突的 DDL')
+    check_parser.add_argument('--line', metavar='VERSION', help='只检查该版本线（如 V7.1 包括 V7.1 与 V7.1.x）')
+    check_parser.add_argument('--no-refresh', action='store_true', help='不扫描目录，直接检查现有索引')
+    parser.add_argument('--catalog', metavar='PATH', help='脚本索引文件，默认为配置文件旁的 sqlhelp_catalog.db')
+    parser.add_argument('--sync', action='store_true',
+                        help='生成后把文件同步到版本目录（内容未变的跳过，校验后原子替换），批量生成时在全部完成后同步')
+    parser.add_argument('--sync-workers', type=int, default=DEFAULT_SYNC_WORKERS, metavar='N', help='同步版本目录的线程数')
+    parser.add_argument('--profile', nargs='?', const='-', metavar='PATH',
+                        help='输出各阶段耗时、按规则类型的语句数和写入字节数（一行 JSON），未指定 PATH 时写到标准错误')
+    parser.add_argument('--profile-cpu', metavar='PATH', help='用 cProfile 记录调用耗时并保存到 PATH（隐含 --profile）')
+    parser.add_argument('--profile-memory', action='store_true', help='用 tracemalloc 记录内存峰值（隐含 --profile）')
+
+    args = parser.parse_args()
+    catalog_path = args.catalog
+    if not catalog_path:
+        from script_catalog import default_catalog_path
+        catalog_path = default_catalog_path(args.config)
+
+    if args.command == 'batch':
+        from batch import run_batch
+        sys.exit(1 if run_batch(args.manifest, args.config, args.workers, vars(args)) else 0)
+
+    if args.command == 'rebuild':
+        from rebuild import run_rebuild
+        sys.exit(1 if run_rebuild(args.manifest, args.config, args.workers, vars(args), args.force) else 0)
+
+    if args.command == 'watch':
+        from watch import run_watch
+        run_watch(args.directory, args.config, args.workers, vars(args), args.debounce, args.poll,
+                  args.interval, args.scan_existing)
+        return
+
+    if args.command == 'check':
+        from conflict_check import run_check
+        config = Config.shared(args.config)
+        sys.exit(1 if run_check(catalog_path, (config.root_dir, config.version_dir), args.line,
+                                not args.no_refresh) else 0)
+
+    if args.command == 'find':
+        from script_catalog import run_find
+        config = Config.shared(args.config)
+        filters = {key: getattr(args, 'find_' + key)
+                   for key in ('requirement_id', 'database', 'version', 'region')}
+        filters.update(table=args.table, column=args.column)
+        sys.exit(0 if run_find(catalog_path, (config.root_dir, config.version_dir), filters,
+                               not args.no_refresh) else 1)
+
+    databases = split_list(args.databases)
+    regions = split_list(args.regions)
+    if databases and args.database or regions and args.region:
+        parser.error('--databases/--regions 不能与 --database/--region 同时使用')
+    database = databases[0] if databases else args.database
+    region = regions[0] if regions else args.region
+
+    # 从标准输入读取 SQL 时无法再交互提示，数据库、版本号、需求号和说明必须通过参数指定
+    interactive = args.sql_file != '-'
+    if not interactive and (database is None or args.version is None or not args.req or not args.desc):
+        parser.error('从标准输入读取 SQL 时必须指定 --database、--version、--req 和 --desc')
+
+    helper = SQLHelper(args.config)
+    metrics = helper.metrics
+    if profile_enabled(vars(args)):
+        metrics = helper.metrics = Metrics('generate')
+    with capture(metrics, args.profile_cpu, args.profile_memory), open_sql_source(args.sql_file) as sql:
+        with metrics.span('input'):
+            user_input = helper.get_user_input(database, args.version, region, args.req, args.desc,
+                                               sql, interactive)
+        for key in OPTION_ARGS:
+            user_input[key] = getattr(args, key)
+        if len(databases) > 1 or len(regions) > 1:
+            file_paths = helper.create_fanout_files(user_input, databases or [user_input['database']],
+                                                    regions or [user_input['region']], args.link_mode)
+        else:
+            file_paths = helper.create_groovy_file(user_input)
+
+        # 已建立索引时直接登记新文件，并检查与已有脚本是否重复或冲突
+        if os.path.exists(catalog_path):
+            from script_catalog import ScriptCatalog
+            from conflict_check import find_conflicts, print_conflicts
+            groovy_paths = [os.path.abspath(path) for path in file_paths if path.endswith('.groovy')]
+            with metrics.span('catalog'), ScriptCatalog(catalog_path) as catalog:
+                catalog.add_files(groovy_paths, helper.config.root_dir)
+                conflicts = find_conflicts(catalog, paths=groovy_paths)
+            if conflicts:
+                print(f"\n{YELLOW}新脚本与已有脚本存在重复或冲突：{RESET}")
+                print_conflicts(conflicts)
+
+        sync_failed = 0
+        if args.sync:
+            from version_sync import run_sync
+            with metrics.span('sync'):
+                sync_failed = run_sync(helper, file_paths, args.sync_workers)
+    if metrics.enabled:
+        metrics.emit(args.profile)
+    if sync_failed:
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
@@ -1,193 +1,130 @@
 import sys
-import json
-import os
-from datetime import datetime
-import re
-from templates.groovy_template import GROOVY_TEMPLATE
+from sqlhelp import SQLHelper, GenerationCancelled
+from sql_incremental import IncrementalAnalyzer
+from metrics import capture, metrics_from_env
+from PyQt5.QtCore import Qt, QThread, QTimer, pyqtSignal
 from PyQt5.QtWidgets import (
-    QApplication, QWidget, QLabel, QVBoxLayout, QPushButton,
-    QComboBox, QTabWidget, QLineEdit, QPlainTextEdit, QMessageBox
+    QApplication, QWidget, QLabel, QVBoxLayout, QHBoxLayout, QPushButton,
+    QComboBox, QTabWidget, QLineEdit, QPlainTextEdit, QMessageBox, QCheckBox,
+    QSpinBox, QDoubleSpinBox, QProgressBar, QSplitter
 )
 
-class Config:
-    def __init__(self, config_path='config.json'):
-        self.config_path = config_path
+# 预览只渲染前若干条语句，保证输入时界面流畅
+PREVIEW_STATEMENTS = 200
+# 停止输入多久后刷新预览（毫秒）
+PREVIEW_DELAY = 400
+
+def sync_combo(combo, items):
+    """增量同步下拉框选项：只插入、移动、删除有差异的项，并保留输入框中的内容"""
+    current = [combo.itemText(i) for i in range(combo.count())]
+    if current == items:
+        return
+    text = combo.currentText()
+    for i, item in enumerate(items):
+        if i < combo.count() and combo.itemText(i) == item:
+            continue
+        existing = combo.findText(item)
+        if existing > i:
+            combo.removeItem(existing)
+        combo.insertItem(i, item)
+    while combo.count() > len(items):
+        combo.removeItem(combo.count() - 1)
+    combo.setCurrentText(text)
+
+
+class GenerateWorker(QThread):
+    """在后台线程中分析 SQL 并写入文件
+
+    使用独立的 SQLHelper，不与界面线程的预览共用生成状态；配置仍通过 Config.shared 共享。
+    """
+    progress = pyqtSignal(str, int, int)
+    succeeded = pyqtSignal(list)
+    failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
+
+    def __init__(self, config_path, user_input):
+        super().__init__()
+        self.helper = SQLHelper(config_path)
+        self.user_input = user_input
+        self._cancel_requested = False
+
+    def cancel(self):
+        self._cancel_requested = True
+
+    def report(self, stage, done, total):
+        if self._cancel_requested:
+            raise GenerationCancelled()
+        self.progress.emit(stage, done, total)
+
+    def run(self):
+        # 设置了 SQLHELP_PROFILE 等环境变量时记录各阶段耗时
+        metrics, target, cpu_path, memory = metrics_from_env('gui')
+        self.helper.metrics = metrics
         try:
-            with open(config_path, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-                self.root_dir = config['root_dir']
-                self.version_dir = config['version_dir']
-                self.responsible_person = config['responsible_person']
-                self.databases = config['databases']
-                self.versions = config['versions']
-                self.regions = config['regions']
-        except FileNotFoundError:
-            print(f"{RED}错误：找不到配置文件 config.json{RESET}")
-            exit(1)
-        except json.JSONDecodeError:
-            print(f"{RED}错误：config.json 格式不正确{RESET}")
-            exit(1)
-
-    def move_to_front(self, list_name, value):
-        """将使用过的选项移到列表首位"""
-        if hasattr(self, list_name):
-            items = getattr(self, list_name)
-            if value in items:
-                items.remove(value)
-            items.insert(0, value)
-            setattr(self, list_name, items)
-            self.save_config()
+            with capture(metrics, cpu_path, memory):
+                file_paths = self.helper.write_groovy_files(self.user_input, self.report)
+        except GenerationCancelled:
+            self.cancelled.emit()
+        except Exception as e:
+            self.failed.emit(str(e))
+        else:
+            self.succeeded.emit(file_paths)
+        finally:
+            if metrics.enabled:
+                metrics.emit(target)
 
-    def save_config(self):
-        """保存配置到文件"""
-        config = {
-            'root_dir': self.root_dir,
-            'version_dir' : self.version_dir,
-            'responsible_person': self.responsible_person,
-            'databases': self.databases,
-            'versions': self.versions,
-            'regions': self.regions
-        }
-        with open(self.config_path, 'w', encoding='utf-8') as f:
-            json.dump(config, f, ensure_ascii=False, indent=2)
 
-class SQLHelper:
-    def __init__(self):
-        self.config = Config()
-    
-    def analyze_sql(self, sql):
-        sql_metas = []
-        statements = [s.strip() for s in sql.split(';') if s.strip()]
-        
-        for statement in statements:
-            if not statement:
-                continue
-                
-            statement_lower = statement.lower()
-            
-            # 分析SQL类型并生成相应的判断逻辑
-            if 'insert into' in statement_lower:
-                sql_metas.append(("", statement))
-            elif 'delete from' in statement_lower:
-                # DELETE 语句不需要检查条件
-                sql_metas.append(("", statement))
-            elif 'add column' in statement_lower:
-                # 新增字段的判断逻辑
-                table_schema = re.search(r'`?(\w+)`?\.`?(\w+)`?', statement)
-                column_name = re.search(r'add\s+column\s+`?(\w+)`?', statement, re.I)
-                if table_schema and column_name:
-                    schema, table = table_schema.groups()
-                    column = column_name.group(1)
-                    check_sql = f"SELECT NOT EXISTS(SELECT * FROM `information_schema`.`COLUMNS` WHERE `TABLE_SCHEMA` = '{schema}' AND `TABLE_NAME` = '{table}' AND `COLUMN_NAME` IN ('{column}'))"
-                    sql_metas.append((check_sql, statement))
-            
-            elif 'modify column' in statement_lower:
-                # 修改字段的判断逻辑
-                table_schema = re.search(r'`?(\w+)`?\.`?(\w+)`?', statement)
-                column_name = re.search(r'modify\s+column\s+`?(\w+)`?', statement, re.I)
-                if table_schema and column_name:
-                    schema, table = table_schema.groups()
-                    column = column_name.group(1)
-                    check_sql = f"SELECT EXISTS(SELECT 1 FROM information_schema.COLUMNS WHERE table_schema = '{schema}' AND table_name = '{table}' AND column_name = '{column}')"
-                    sql_metas.append((check_sql, statement))
-            
-            elif 'add index' in statement_lower or 'add key' in statement_lower:
-                # 新增索引的判断逻辑
-                table_schema = re.search(r'`?(\w+)`?\.`?(\w+)`?', statement)
-                index_name = re.search(r'add\s+(?:index|key)\s+`?(\w+)`?', statement, re.I)
-                if table_schema and index_name:
-                    schema, table = table_schema.groups()
-                    index = index_name.group(1)
-                    check_sql = f"SELECT NOT EXISTS (SELECT * FROM information_schema.statistics WHERE table_schema='{schema}' AND table_name = '{table}' AND index_name = '{index}')"
-                    sql_metas.append((check_sql, statement))
-            else:
-                # 对于其他类型的SQL，不添加判断逻辑
-                sql_metas.append(("", statement))
-                
-        return sql_metas
-
-    def generate_file_name(self, user_input):
-        date_str = datetime.now().strftime('%Y%m%d')
-        # 数据库名使用大写
-        db_name = user_input['database'].upper()
-        requirement_id = user_input['requirement_id']
-        
-        # 如果 requirement_id 包含 @，则不加 #
-        requirement_part = requirement_id if '@' in requirement_id else f"#{requirement_id}"
-        
-        return f"DB_{db_name}_{requirement_part}_01_{date_str}_{user_input['description']}"
-
-    def generate_groovy_content(self, user_input, sql_metas):
-        sql_statements = []
-        for check_sql, sql in sql_metas:
-            if check_sql:
-                sql_statements.append(f"            add(SqlMeta.build(\"{check_sql}\", ''' {sql}; '''))")
-            else:
-                sql_statements.append(f"            add(SqlMeta.build(\"\", ''' {sql}; '''))")
-
-        return GROOVY_TEMPLATE.format(
-            version=user_input['version'],
-            database=user_input['database'].lower(),  # 数据库名使用小写
-            change_id=self.generate_file_name(user_input),  # 不包含.groovy后缀
-            responsible_person=self.config.responsible_person,
-            sql_statements='\n'.join(sql_statements)
-        )
-
-    def create_groovy_file(self, user_input):
-        # 子文件夹
-        note = user_input.get('database', '')
-        # 确保 note 是字符串，并进行安全分割
-        note = note.rsplit('_', 1)[-1] if '_' in note else note
-        note = note.rsplit('-', 1)[-1] if '-' in note else note
-        dir_path = os.path.join(
-            self.config.root_dir,
-            user_input['version'],
-            '01.数据库脚本',
-            user_input['region'],
-            note
-        )
-        # 父文件夹
-        prent = self.get_parent_folder(user_input['version'])
-
-        version_dir = os.path.join(
-            self.config.version_dir,
-            prent,
-            user_input['version'],
-            '01.数据库脚本',
-            user_input['region'],
-            note
-        )
-        os.makedirs(dir_path, exist_ok=True)
-
-        # 生成文件名和内容
-        file_name = self.generate_file_name(user_input) + '.groovy'  # 这里添加.groovy后缀
-        file_path = os.path.join(dir_path, file_name)
-        
-        # 分析SQL并生成内容
-        sql_metas = self.analyze_sql(user_input['sql'])
-        content = self.generate_groovy_content(user_input, sql_metas)
-
-        # 写入文件
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(content)
-
-        print(f"\n文件已生成：{file_path}")
-        print(f"\n文件路径：{dir_path}")
-        print(f"\n版本路径：{version_dir}")
-        
-    def get_parent_folder(self, version):
-        match = re.match(r'^(V\d+)\.(\d+)', version)  # 提取主版本号 (Vx) 和次版本号 (y)
-        if match:
-            major_version, minor_version = match.groups()  # major_version = "V7", minor_version = "1"
-            return f"{major_version}.0/{major_version}.{minor_version}"  # 生成 "V7.0/V7.1" 格式
-        return "V6.0"  # 默认情况
+class PreviewWorker(QThread):
+    """在后台线程中增量分析并渲染预览，粘贴大脚本时界面不卡顿"""
+    rendered = pyqtSignal(str, str)  # (分析统计, 预览内容)
+
+    def __init__(self, helper, analyzer, user_input):
+        super().__init__()
+        self.helper = helper
+        self.analyzer = analyzer
+        self.user_input = user_input
+
+    def run(self):
+        user_input = self.user_input
+        summary = ''
+        try:
+            all_metas = self.analyzer.update(user_input["sql"])
+            stats = self.analyzer.stats
+            summary = (f"共 {len(all_metas)} 条语句，缓存命中 {stats['hits']}，重新分析 {stats['misses']}，"
+                       f"直接复用 {stats['reused']}")
+            truncated = len(all_metas) > PREVIEW_STATEMENTS
+            sql_metas, notes = self.helper.optimize_sql_metas(all_metas[:PREVIEW_STATEMENTS], user_input)
+            if truncated:
+                notes.append(f"预览仅显示前 {PREVIEW_STATEMENTS} 条语句")
+            content = self.helper.generate_groovy_content(user_input, sql_metas, notes)
+        except Exception as e:
+            content = f"预览失败: {str(e)}"
+        self.rendered.emit(summary, content)
+
 
 class GeneratePage(QWidget):
     def __init__(self):
         super().__init__()
         self.helper = SQLHelper()
-        self.config = self.helper.config  # 读取配置
+        self.config = self.helper.config  # 读取配置（进程内共享）
+        # 预览只重新分析编辑过的语句
+        self.analyzer = IncrementalAnalyzer(self.helper.analyze_statement)
+        self.worker = None
+        # 预览在后台线程中进行，同一时间只有一个；进行中又有修改时，完成后按最新内容再预览一次
+        self.preview_worker = None
+        self.preview_pending = False
         self.initUI()
+        self.config.add_listener(self.on_config_changed)
+
+    def on_config_changed(self, fields):
+        combos = {
+            'databases': self.db_combo,
+            'versions': self.version_combo,
+            'regions': self.region_combo,
+        }
+        for field in fields:
+            if field in combos:
+                sync_combo(combos[field], getattr(self.config, field))
 
     def initUI(self):
         layout = QVBoxLayout()
@@ -218,13 +155,61 @@ class GeneratePage(QWidget):
         self.description_label = QLabel("脚本说明:")
         self.description_input = QLineEdit()
 
-        # SQL 输入框
-        self.sql_label = QLabel("SQL语句:")
+        # SQL 输入框与实时预览
+        self.sql_label = QLabel("SQL语句 / 脚本预览:")
         self.sql_input = QPlainTextEdit()
-
-        # 提交按钮
+        self.preview = QPlainTextEdit()
+        self.preview.setReadOnly(True)
+        self.preview.setLineWrapMode(QPlainTextEdit.NoWrap)
+        self.sql_splitter = QSplitter(Qt.Horizontal)
+        self.sql_splitter.addWidget(self.sql_input)
+        self.sql_splitter.addWidget(self.preview)
+        self.analysis_label = QLabel()
+
+        # 停止输入后再刷新预览
+        self.preview_timer = QTimer(self)
+        self.preview_timer.setSingleShot(True)
+        self.preview_timer.setInterval(PREVIEW_DELAY)
+        self.preview_timer.timeout.connect(self.update_preview)
+        self.sql_input.textChanged.connect(self.preview_timer.start)
+        self.requirement_input.textChanged.connect(self.preview_timer.start)
+        self.description_input.textChanged.connect(self.preview_timer.start)
+        for combo in (self.db_combo, self.version_combo):
+            combo.currentTextChanged.connect(self.preview_timer.start)
+
+        # 生成选项
+        self.table_guards_check = QCheckBox("按表合并判断（每张表只查询一次 information_schema）")
+        self.merge_alters_check = QCheckBox("合并连续的同表 ADD COLUMN/ADD INDEX 语句")
+        self.insert_batch_label = QLabel("INSERT 合并行数（0 为不合并）:")
+        self.insert_batch_spin = QSpinBox()
+        self.insert_batch_spin.setRange(0, 100000)
+        self.dml_batch_label = QLabel("DELETE/UPDATE 分批行数（0 为不分批）:")
+        self.dml_batch_spin = QSpinBox()
+        self.dml_batch_spin.setRange(0, 1000000)
+        self.dml_sleep_label = QLabel("分批间隔（秒）:")
+        self.dml_sleep_spin = QDoubleSpinBox()
+        self.dml_sleep_spin.setRange(0, 60)
+        self.dml_sleep_spin.setSingleStep(0.1)
+        self.dml_remainder_check = QCheckBox("超出最大批数仍有剩余的行时不分批执行（默认报错）")
+
+        for check in (self.table_guards_check, self.merge_alters_check, self.dml_remainder_check):
+            check.toggled.connect(self.preview_timer.start)
+        for spin in (self.insert_batch_spin, self.dml_batch_spin, self.dml_sleep_spin):
+            spin.valueChanged.connect(self.preview_timer.start)
+
+        # 提交按钮、进度与取消
         self.submit_button = QPushButton("生成脚本")
         self.submit_button.clicked.connect(self.generate_groovy_file)
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 1000)
+        self.progress_bar.hide()
+        self.cancel_button = QPushButton("取消")
+        self.cancel_button.clicked.connect(self.cancel_generate)
+        self.cancel_button.hide()
+        action_layout = QHBoxLayout()
+        action_layout.addWidget(self.submit_button)
+        action_layout.addWidget(self.progress_bar)
+        action_layout.addWidget(self.cancel_button)
 
         # 添加到布局
         layout.addWidget(self.db_label)
@@ -238,43 +223,128 @@ class GeneratePage(QWidget):
         layout.addWidget(self.description_label)
         layout.addWidget(self.description_input)
         layout.addWidget(self.sql_label)
-        layout.addWidget(self.sql_input)
-        layout.addWidget(self.submit_button)
+        layout.addWidget(self.sql_splitter)
+        layout.addWidget(self.analysis_label)
+        layout.addWidget(self.table_guards_check)
+        layout.addWidget(self.merge_alters_check)
+        layout.addWidget(self.insert_batch_label)
+        layout.addWidget(self.insert_batch_spin)
+        layout.addWidget(self.dml_batch_label)
+        layout.addWidget(self.dml_batch_spin)
+        layout.addWidget(self.dml_sleep_label)
+        layout.addWidget(self.dml_sleep_spin)
+        layout.addWidget(self.dml_remainder_check)
+        layout.addLayout(action_layout)
 
         self.setLayout(layout)
 
-    def generate_groovy_file(self):
-        # 获取用户输入
-        user_input = {
+    def collect_user_input(self):
+        return {
             "database": self.db_combo.currentText(),
             "version": self.version_combo.currentText(),
             "region": self.region_combo.currentText(),
             "requirement_id": self.requirement_input.text(),
             "description": self.description_input.text(),
-            "sql": self.sql_input.toPlainText()
+            "sql": self.sql_input.toPlainText(),
+            "table_guards": self.table_guards_check.isChecked(),
+            "merge_alters": self.merge_alters_check.isChecked(),
+            "insert_batch_rows": self.insert_batch_spin.value(),
+            "dml_batch_size": self.dml_batch_spin.value(),
+            "dml_sleep": self.dml_sleep_spin.value(),
+            "dml_remainder": self.dml_remainder_check.isChecked()
         }
 
+    def update_preview(self):
+        """渲染前 PREVIEW_STATEMENTS 条语句的脚本，每条语句的判断SQL一并显示"""
+        if self.preview_worker:
+            self.preview_pending = True
+            return
+        self.preview_worker = PreviewWorker(self.helper, self.analyzer, self.collect_user_input())
+        self.preview_worker.rendered.connect(self.on_preview_rendered)
+        self.preview_worker.finished.connect(self.on_preview_finished)
+        self.preview_worker.start()
+
+    def on_preview_rendered(self, summary, content):
+        if summary:
+            self.analysis_label.setText(summary)
+        self.preview.setPlainText(content)
+
+    def on_preview_finished(self):
+        self.preview_worker = None
+        if self.preview_pending:
+            self.preview_pending = False
+            self.update_preview()
+
+    def generate_groovy_file(self):
+        # 获取用户输入
+        user_input = self.collect_user_input()
+
         if not user_input["requirement_id"] or not user_input["sql"].strip() or not user_input["description"]:
             QMessageBox.warning(self, "输入错误", "需求号、脚本说明、SQL 语句不能为空！")
             return
 
-        try:
-            self.helper.create_groovy_file(user_input)
-            QMessageBox.information(self, "成功", "SQL 模板文件已生成！")
-            # 切换数据库配置
-            self.config.move_to_front("databases", user_input["database"])
-            self.config.move_to_front("versions", user_input["version"])
-            self.config.move_to_front("regions", user_input["region"])
-            self.config.save_config()
-        except Exception as e:
-            QMessageBox.critical(self, "错误", f"文件生成失败: {str(e)}")
+        # 在后台线程中生成，界面保持响应
+        self.worker = GenerateWorker(self.config.config_path, user_input)
+        self.worker.progress.connect(self.on_generate_progress)
+        self.worker.succeeded.connect(self.on_generate_succeeded)
+        self.worker.failed.connect(self.on_generate_failed)
+        self.worker.cancelled.connect(self.on_generate_cancelled)
+        self.worker.finished.connect(self.on_generate_finished)
+        self.submit_button.setEnabled(False)
+        self.progress_bar.setValue(0)
+        self.progress_bar.show()
+        self.cancel_button.show()
+        self.worker.start()
+
+    def cancel_generate(self):
+        if self.worker:
+            self.worker.cancel()
+
+    def on_generate_progress(self, stage, done, total):
+        self.progress_bar.setFormat(f"{stage} %p%")
+        if total:
+            self.progress_bar.setRange(0, 1000)
+            self.progress_bar.setValue(done * 1000 // total)
+        else:
+            self.progress_bar.setRange(0, 0)  # 总量未知
+
+    def on_generate_succeeded(self, file_paths):
+        user_input = self.worker.user_input
+        QMessageBox.information(self, "成功", "SQL 模板文件已生成！\n" + "\n".join(file_paths))
+        # 切换数据库配置
+        self.config.move_to_front("databases", user_input["database"])
+        self.config.move_to_front("versions", user_input["version"])
+        self.config.move_to_front("regions", user_input["region"])
+        self.config.save_config()
+
+    def on_generate_failed(self, message):
+        QMessageBox.critical(self, "错误", f"文件生成失败: {message}")
+
+    def on_generate_cancelled(self):
+        QMessageBox.information(self, "已取消", "脚本生成已取消，未保留任何文件。")
+
+    def on_generate_finished(self):
+        self.submit_button.setEnabled(True)
+        self.progress_bar.hide()
+        self.cancel_button.hide()
+        self.worker = None
 
 class ConfigPage(QWidget):
     def __init__(self):
         super().__init__()
         self.helper = SQLHelper()
-        self.config = self.helper.config  # 读取配置
+        self.config = self.helper.config  # 读取配置（进程内共享）
         self.initUI()
+        self.config.add_listener(self.on_config_changed)
+
+    def on_config_changed(self, fields):
+        # 用户已修改、尚未保存的输入框保留用户的内容（setText 会清除修改标记）
+        for field in fields:
+            line_edit = self.inputs[field]
+            if line_edit.isModified():
+                continue
+            value = getattr(self.config, field)
+            line_edit.setText(",".join(value) if isinstance(value, list) else value)
 
     def initUI(self):
         layout = QVBoxLayout()
@@ -292,6 +362,14 @@ class ConfigPage(QWidget):
         self.root_path_input = QLineEdit(self.config.root_dir)
         self.version_path_label = QLabel("发版目录:")
         self.version_path_input = QLineEdit(self.config.version_dir)
+        self.inputs = {
+            'databases': self.db_input,
+            'versions': self.version_input,
+            'regions': self.region_input,
+            'responsible_person': self.use_name_input,
+            'root_dir': self.root_path_input,
+            'version_dir': self.version_path_input,
+        }
 
         # 保存按钮
         self.save_button = QPushButton("保存配置")
@@ -323,6 +401,10 @@ class ConfigPage(QWidget):
             self.config.root_dir = self.root_path_input.text()
             self.config.version_dir = self.version_path_input.text()
             self.config.save_config()
+            # 保存时已与文件中其他进程的修改合并，显示合并后的结果
+            for line_edit in self.inputs.values():
+                line_edit.setModified(False)
+            self.on_config_changed(list(self.inputs))
             QMessageBox.information(self, "成功", "配置已保存！")
         except Exception as e:
             QMessageBox.critical(self, "错误", f"保存配置失败: {str(e)}")
@@ -349,25 +431,8 @@ class MainWindow(QWidget):
         self.setLayout(layout)
 
     def update_config(self, index):
-        # 获取最新的配置
-        new_config = Config()
-        if index == 0:  # 刷新脚本页面
-            self.page1.config = new_config
-            self.page1.db_combo.clear()
-            self.page1.db_combo.addItems(new_config.databases)
-            self.page1.version_combo.clear()
-            self.page1.version_combo.addItems(new_config.versions)
-            self.page1.region_combo.clear()
-            self.page1.region_combo.addItems(new_config.regions)
-
-        elif index == 1:  # 刷新配置页面
-            self.page2.config = new_config
-            self.page2.db_input.setText(",".join(new_config.databases))
-            self.page2.version_input.setText(",".join(new_config.versions))
-            self.page2.region_input.setText(",".join(new_config.regions))
-            self.page2.use_name_input.setText(new_config.responsible_person)
-            self.page2.root_path_input.setText(new_config.root_dir)
-            self.page2.version_path_input.setText(new_config.version_dir)
+        # 配置文件有变化时才重新读取，页面通过变化通知增量刷新
+        self.page1.config.reload()
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
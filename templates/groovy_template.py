@@ -1,6 +1,6 @@
 GROOVY_TEMPLATE = '''/**
  * 脚本示例
- */
+{notes} */
 class ScriptExample extends AbstractScriptTpl {{
     /**
      * 数据库版本
@@ -51,4 +51,15 @@ class ScriptExample extends AbstractScriptTpl {{
         }}
     }}
 }}
-''' 
\ No newline at end of file
+'''
+
+# 流式写入用：模板在语句处一分为二，文件头每个文件填充一次，文件尾预先去掉转义
+GROOVY_HEADER, GROOVY_FOOTER = GROOVY_TEMPLATE.split('{sql_statements}')
+GROOVY_FOOTER = GROOVY_FOOTER.format()
+
+# 分批执行的语句：循环添加，每批执行前重新判断是否仍有数据
+GROOVY_LOOP_TEMPLATE = """                // 分批执行，最多 {times} 批
+                {times}.times {{
+{statements}
+                }}
+{remainder}"""
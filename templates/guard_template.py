@@ -0,0 +1,20 @@
+# 表级判断模板：每张表只查询一次 information_schema，结果缓存在会话变量中，
+# 后续语句的判断只读取变量。要求同一脚本的 SqlMeta 在同一个数据库连接中执行。
+
+# 放宽 GROUP_CONCAT 长度限制，避免字段较多的表被截断
+GROUP_CONCAT_SETUP_SQL = "SET SESSION group_concat_max_len = 1048576"
+
+# 一次取出表的全部字段名和索引名（小写、逗号分隔）
+TABLE_PREFETCH_SQL = (
+    "SELECT "
+    "(SELECT GROUP_CONCAT(LOWER(COLUMN_NAME)) FROM information_schema.COLUMNS "
+    "WHERE TABLE_SCHEMA = {schema} AND TABLE_NAME = '{table}'), "
+    "(SELECT GROUP_CONCAT(DISTINCT LOWER(INDEX_NAME)) FROM information_schema.STATISTICS "
+    "WHERE TABLE_SCHEMA = {schema} AND TABLE_NAME = '{table}') "
+    "INTO @{var}_columns, @{var}_indexes"
+)
+
+CACHED_COLUMN_NOT_EXISTS = "SELECT NOT FIND_IN_SET(LOWER('{column}'), IFNULL(@{var}_columns, ''))"
+CACHED_COLUMN_EXISTS = "SELECT FIND_IN_SET(LOWER('{column}'), IFNULL(@{var}_columns, '')) > 0"
+CACHED_INDEX_NOT_EXISTS = "SELECT NOT FIND_IN_SET(LOWER('{index}'), IFNULL(@{var}_indexes, ''))"
+CACHED_INDEX_EXISTS = "SELECT FIND_IN_SET(LOWER('{index}'), IFNULL(@{var}_indexes, '')) > 0"
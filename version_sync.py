@@ -0,0 +1,101 @@
+import hashlib
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlhelp import _UMASK, DEFAULT_SYNC_WORKERS, file_hash, GREEN, YELLOW, RED, RESET
+
+ADDED = 'added'
+UPDATED = 'updated'
+SKIPPED = 'skipped'
+STATUS_LABELS = {ADDED: '新增', UPDATED: '更新', SKIPPED: '未变'}
+
+_CHUNK_SIZE = 1 << 20
+
+
+def version_path(helper, file_path):
+    """生成目录中的文件在版本目录中的对应路径
+
+    root_dir/{版本号}/... 对应 version_dir/{父文件夹}/{版本号}/...，与 get_output_dirs 一致。
+    """
+    config = helper.config
+    relative = os.path.relpath(os.path.abspath(file_path), os.path.abspath(config.root_dir))
+    if relative.startswith(os.pardir + os.sep) or relative == os.pardir:
+        raise ValueError(f"{file_path} 不在生成目录 {config.root_dir} 中")
+    version = relative.split(os.sep, 1)[0]
+    return os.path.join(config.version_dir, helper.get_parent_folder(version), relative)
+
+
+def sync_file(src, dst):
+    """把 src 复制到 dst：内容相同时跳过，否则写临时文件、校验后原子替换，返回 ADDED/UPDATED/SKIPPED"""
+    src_hash = file_hash(src)
+    if os.path.isfile(dst):
+        if os.path.getsize(dst) == os.path.getsize(src) and file_hash(dst) == src_hash:
+            return SKIPPED
+        status = UPDATED
+    else:
+        status = ADDED
+
+    dir_path = os.path.dirname(os.path.abspath(dst))
+    os.makedirs(dir_path, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=dir_path, prefix='.tmp-')
+    try:
+        digest = hashlib.sha256()
+        with os.fdopen(fd, 'wb') as target, open(src, 'rb') as source:
+            for chunk in iter(lambda: source.read(_CHUNK_SIZE), b''):
+                digest.update(chunk)
+                target.write(chunk)
+            target.flush()
+            os.fsync(target.fileno())
+        # 写入的内容必须与比较时读到的一致，否则说明源文件在复制过程中被修改
+        if digest.hexdigest() != src_hash:
+            raise OSError(f"{src} 在复制过程中被修改，请重新同步")
+        os.chmod(tmp_path, 0o666 & ~_UMASK)
+        os.replace(tmp_path, dst)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return status
+
+
+def sync_files(pairs, workers=DEFAULT_SYNC_WORKERS):
+    """并行同步 [(源文件, 目标文件)]，按输入顺序返回 [(源文件, 目标文件, 状态, 错误)]"""
+    def sync(pair):
+        src, dst = pair
+        try:
+            return src, dst, sync_file(src, dst), None
+        except OSError as e:
+            return src, dst, None, e
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(sync, pairs))
+
+
+def run_sync(helper, file_paths, workers=DEFAULT_SYNC_WORKERS):
+    """把生成的文件同步到版本目录并打印汇总，返回失败的文件数"""
+    started = time.perf_counter()
+    pairs = []
+    failed = 0
+    for file_path in dict.fromkeys(file_paths):
+        try:
+            pairs.append((file_path, version_path(helper, file_path)))
+        except ValueError as e:
+            failed += 1
+            print(f"{RED}同步失败：{e}{RESET}")
+
+    counts = dict.fromkeys(STATUS_LABELS, 0)
+    for src, dst, status, error in sync_files(pairs, workers):
+        if error:
+            failed += 1
+            print(f"{RED}同步失败：{src}：{error}{RESET}")
+            continue
+        counts[status] += 1
+        if status != SKIPPED:
+            print(f"{GREEN}[{STATUS_LABELS[status]}] {dst}{RESET}")
+
+    color = RED if failed else GREEN if counts[ADDED] or counts[UPDATED] else YELLOW
+    print(f"\n{color}版本目录同步：新增 {counts[ADDED]}，更新 {counts[UPDATED]}，未变跳过 {counts[SKIPPED]}，"
+          f"失败 {failed}，耗时 {time.perf_counter() - started:.2f}s{RESET}")
+    return failed
@@ -0,0 +1,309 @@
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import signal
+import struct
+import sys
+import time
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import batch
+from batch import OPTION_FIELDS, PATH_FIELDS, REQUIRED_FIELDS, build_user_input
+from rebuild import existing_date, row_key
+from sqlhelp import SQLHelper, GREEN, YELLOW, RED, RESET
+
+# 文件最后一次变化后等待多久再生成，编辑器保存、复制大文件时的连续写入合并为一次
+DEFAULT_DEBOUNCE = 0.3
+# 轮询方式的扫描间隔（秒）
+DEFAULT_INTERVAL = 0.5
+SIDECAR_SUFFIX = '.json'
+# 文件名中各字段的分隔符：{库}__{版本号}[__{区划}]__{需求号}__{说明}.sql
+NAME_SEPARATOR = '__'
+NAME_FIELDS = ('database', 'version', 'requirement_id', 'description')
+NAME_FIELDS_WITH_REGION = ('database', 'version', 'region', 'requirement_id', 'description')
+
+# inotify 常量（linux/inotify.h）
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+_EVENT = struct.Struct('iIII')
+
+
+def _init_worker(config_path):
+    # Ctrl+C 由主进程处理，工作进程随进程池一起退出
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    batch._init_worker(config_path)
+
+
+def _iter_files(root):
+    """递归列出 root 下的文件，返回 (路径, stat)，跳过隐藏文件和目录"""
+    stack = [root]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file():
+                    try:
+                        yield entry.path, entry.stat()
+                    except OSError:
+                        continue
+
+
+class PollingWatcher:
+    """按修改时间和大小定期扫描目录，任何平台都可用"""
+
+    name = 'polling'
+
+    def __init__(self, root, interval=DEFAULT_INTERVAL):
+        self.root = root
+        self.interval = interval
+        self._snapshot = self._scan()
+        self._next_scan = time.monotonic() + interval
+
+    def _scan(self):
+        return {path: (stat.st_mtime_ns, stat.st_size) for path, stat in _iter_files(self.root)}
+
+    def poll(self, timeout):
+        """等待最多 timeout 秒，返回新增或修改的文件路径；两次扫描至少间隔 interval 秒"""
+        wait_time = self._next_scan - time.monotonic()
+        if wait_time > timeout:
+            time.sleep(timeout)
+            return []
+        time.sleep(max(0.0, wait_time))
+        self._next_scan = time.monotonic() + self.interval
+        snapshot = self._scan()
+        changed = [path for path, state in snapshot.items() if self._snapshot.get(path) != state]
+        self._snapshot = snapshot
+        return changed
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """通过 inotify 接收文件变化（仅 Linux），子目录一并监视"""
+
+    name = 'inotify'
+
+    def __init__(self, root):
+        self.root = root
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self._dirs = {}  # 监视描述符 -> 目录
+        self._add_tree(root)
+
+    def _add_watch(self, path):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), _WATCH_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), path)
+        self._dirs[wd] = path
+
+    def _add_tree(self, root):
+        """监视 root 及其子目录，返回其中已有的文件（目录刚创建时其中可能已有文件）"""
+        files = []
+        stack = [root]
+        while stack:
+            path = stack.pop()
+            try:
+                self._add_watch(path)
+                entries = list(os.scandir(path))
+            except OSError:
+                continue
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                else:
+                    files.append(entry.path)
+        return files
+
+    def poll(self, timeout):
+        """等待最多 timeout 秒，返回有变化的文件路径"""
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self._fd, 1 << 16)
+        except BlockingIOError:
+            return []
+        changed = []
+        pos = 0
+        while pos < len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, pos)
+            name = os.fsdecode(data[pos + _EVENT.size:pos + _EVENT.size + length].rstrip(b'\0'))
+            pos += _EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                # 事件队列溢出，丢失的变化无法得知，全部重新处理
+                changed.extend(path for path, _ in _iter_files(self.root))
+                continue
+            directory = self._dirs.get(wd)
+            if directory is None or not name or name.startswith('.'):
+                continue
+            path = os.path.join(directory, name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    changed.extend(self._add_tree(path))
+            else:
+                changed.append(path)
+        return changed
+
+    def close(self):
+        os.close(self._fd)
+
+
+def create_watcher(root, polling=False, interval=DEFAULT_INTERVAL):
+    """优先使用 inotify，不可用（非 Linux、监视数达到上限等）时改为轮询"""
+    if not polling and sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(root)
+        except OSError as e:
+            print(f"{YELLOW}inotify 不可用（{e}），改为每 {interval} 秒轮询{RESET}")
+    return PollingWatcher(root, interval)
+
+
+def sql_path_for(path):
+    """变化的文件对应的 SQL 文件：SQL 文件本身，或附带元数据文件旁的同名 .sql"""
+    if path.endswith('.sql'):
+        return path
+    if path.endswith(SIDECAR_SUFFIX):
+        sql_path = path[:-len(SIDECAR_SUFFIX)] + '.sql'
+        if os.path.isfile(sql_path):
+            return sql_path
+    return None
+
+
+def parse_file_name(sql_path):
+    """从文件名 {库}__{版本号}[__{区划}]__{需求号}__{说明}.sql 中取出元数据，不符合格式时返回空字典"""
+    parts = os.path.basename(sql_path)[:-len('.sql')].split(NAME_SEPARATOR)
+    for fields in (NAME_FIELDS, NAME_FIELDS_WITH_REGION):
+        if len(parts) == len(fields) and all(parts):
+            return dict(zip(fields, parts))
+    return {}
+
+
+def load_metadata(sql_path, default_region, defaults=None):
+    """合并附带的元数据文件（同名 .json，字段与批量清单相同）与文件名中的字段，返回清单行
+
+    元数据文件中的字段优先；缺少必填字段时抛出 ValueError。
+    """
+    row = parse_file_name(sql_path)
+    sidecar = sql_path[:-len('.sql')] + SIDECAR_SUFFIX
+    if os.path.isfile(sidecar):
+        try:
+            with open(sidecar, 'r', encoding='utf-8') as f:
+                metadata = json.load(f)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"{os.path.basename(sidecar)} 格式不正确：{e}")
+        base_dir = os.path.dirname(sidecar)
+        for key in PATH_FIELDS:
+            if metadata.get(key):
+                metadata[key] = os.path.join(base_dir, metadata[key])
+        row.update(metadata)
+    row['sql_path'] = sql_path
+    missing = [key for key in REQUIRED_FIELDS if not row.get(key)]
+    if missing:
+        raise ValueError(f"缺少字段：{', '.join(missing)}（文件名格式为 "
+                         f"库{NAME_SEPARATOR}版本号{NAME_SEPARATOR}需求号{NAME_SEPARATOR}说明.sql，或提供同名 .json）")
+    row.setdefault('region', default_region)
+    for key in OPTION_FIELDS:
+        if defaults and key in defaults:
+            row.setdefault(key, defaults[key])
+    return row
+
+
+def run_watch(root, config_path='config.json', workers=None, options=None, debounce=DEFAULT_DEBOUNCE,
+              polling=False, interval=DEFAULT_INTERVAL, scan_existing=False):
+    """监视 root 下的 .sql 文件，新增或修改后自动生成脚本，直到 Ctrl+C"""
+    root = os.path.abspath(root)
+    config_path = os.path.abspath(config_path)
+    helper = SQLHelper(config_path)
+    workers = workers or min(4, os.cpu_count() or 1)
+    watcher = create_watcher(root, polling, interval)
+    pending = {}  # SQL 文件 -> (首次变化时间, 最后一次变化时间)
+    running = {}  # future -> (SQL 文件, 首次变化时间)
+    dates = {}  # 清单行标识 -> 首次生成时的日期，重新生成时文件名保持不变
+    if scan_existing:
+        now = time.monotonic()
+        pending.update((path, (now, now)) for path, _ in _iter_files(root) if path.endswith('.sql'))
+
+    print(f"{GREEN}正在监视 {root}（{watcher.name}，{workers} 个进程），按 Ctrl+C 退出{RESET}")
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(config_path,))
+    try:
+        while True:
+            now = time.monotonic()
+            timeout = 1.0
+            if pending:
+                timeout = max(0.01, min(last for _, last in pending.values()) + debounce - now)
+            if running:
+                timeout = min(timeout, 0.05)
+            for path in watcher.poll(timeout):
+                sql_path = sql_path_for(path)
+                if sql_path:
+                    now = time.monotonic()
+                    first = pending.get(sql_path, (now, now))[0]
+                    pending[sql_path] = (first, now)
+
+            # 已完成的任务
+            if running:
+                done, _ = wait(running, timeout=0, return_when=FIRST_COMPLETED)
+                for future in done:
+                    sql_path, first = running.pop(future)
+                    try:
+                        file_paths, _, _ = future.result()
+                    except Exception as e:
+                        print(f"{RED}[{os.path.basename(sql_path)}] 生成失败：{e}{RESET}")
+                        continue
+                    elapsed = (time.monotonic() - first) * 1000
+                    print(f"{GREEN}[{os.path.basename(sql_path)}] 已生成（{elapsed:.0f} ms）：{', '.join(file_paths)}{RESET}")
+                    if options and options.get('sync'):
+                        from version_sync import run_sync, DEFAULT_SYNC_WORKERS
+                        run_sync(helper, file_paths, options.get('sync_workers') or DEFAULT_SYNC_WORKERS)
+
+            # 停止变化超过 debounce 的文件交给进程池；同一文件正在生成时等它完成，提交数不超过进程数的两倍
+            now = time.monotonic()
+            busy = {sql_path for sql_path, _ in running.values()}
+            for sql_path, (first, last) in list(pending.items()):
+                if len(running) >= workers * 2:
+                    break
+                if now - last < debounce or sql_path in busy:
+                    continue
+                del pending[sql_path]
+                if not os.path.isfile(sql_path):
+                    continue
+                try:
+                    row = load_metadata(sql_path, helper.config.regions[0], options)
+                except ValueError as e:
+                    print(f"{YELLOW}[{os.path.basename(sql_path)}] 跳过：{e}{RESET}")
+                    continue
+                key = row_key(row)
+                if key not in dates:
+                    dates[key] = existing_date(helper, build_user_input(row)) or datetime.now().strftime('%Y%m%d')
+                row.setdefault('date', dates[key])
+                running[pool.submit(batch._generate, row)] = (sql_path, first)
+                busy.add(sql_path)
+    except KeyboardInterrupt:
+        print(f"\n{YELLOW}已停止监视{RESET}")
+    finally:
+        watcher.close()
+        pool.shutdown(wait=True, cancel_futures=True)